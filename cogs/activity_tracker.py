@@ -1,10 +1,21 @@
 ﻿import discord
 import asyncio
-from discord.ext import commands
+import io
+import time
+import yaml
+from discord.ext import commands, tasks
+from discord import app_commands
 from datetime import datetime
 from utils import database
+from utils.db import db
+from utils.voice_sessions import VoiceSessionTracker
+from utils.promotions import PromotionEngine, compile_demotions
+from utils.rate_limit import RateLimiter
+from utils import simulator
+from utils import rollups
 # We no longer need to import log_action here
-from utils.role_utils import handle_role_add
+from utils.role_utils import handle_role_add, toggle_role
+from utils.logger import log_action, log_summary
 import colorama
 from colorama import Fore, Style, init
 colorama.init(autoreset=True)
@@ -13,65 +24,413 @@ class ActivityTrackerCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.config = bot.config.get("auto_promotion", {})
-        self.vc_join_times = {}
+        self.promotions = PromotionEngine(self.config)
 
-    async def _check_promotion(self, member: discord.Member):
-    # Check if the whole auto-promotion system is enabled
-        if not self.config.get("enabled", False):
+        # Open voice sessions, credited to the database on every checkpoint
+        self.vc_sessions = VoiceSessionTracker()
+        self._recovered_sessions = False
+        checkpoint_minutes = bot.config.get("voice_sessions", {}).get("checkpoint_minutes", 5)
+        self.checkpoint_vc_sessions.change_interval(minutes=checkpoint_minutes)
+        self.checkpoint_vc_sessions.start()
+
+        # Scheduled guild-wide promotion sweep
+        self.sweep_config = self.config.get("sweep", {})
+        self._sweep_lock = asyncio.Lock()
+        if self.promotions.enabled and self.sweep_config.get("enabled", False):
+            self.promotion_sweep_task.change_interval(hours=self.sweep_config.get("interval_hours", 6))
+            self.promotion_sweep_task.start()
+
+        # Daily buckets are only needed as far back as the longest rule window
+        windows = [window for window in self.promotions.windows if window is not None]
+        self.daily_bucket_days = max(windows + [int(self.config.get("daily_bucket_days", 90))])
+        self.compact_daily_buckets.start()
+
+        # Raw event rollups and retention
+        self.retention_config = bot.config.get("retention", {})
+        if self.retention_config.get("enabled", False):
+            self.maintain_event_tables.change_interval(minutes=self.retention_config.get("interval_minutes", 60))
+            self.maintain_event_tables.start()
+
+        # Scheduled inactivity demotions (the reverse of the promotion rules)
+        self.demotion_rules = compile_demotions(self.config)
+        self.demotion_config = self.config.get("demotion_sweep", {})
+        if self.demotion_rules and self.demotion_config.get("enabled", False):
+            self.demotion_sweep_task.change_interval(hours=self.demotion_config.get("interval_hours", 24))
+            self.demotion_sweep_task.start()
+
+    promotions_group = app_commands.Group(name="promotions", description="Automatic promotion tools.")
+
+    async def cog_unload(self):
+        """Stops the background tasks and closes every open session so no VC time is lost on shutdown."""
+        self.checkpoint_vc_sessions.cancel()
+        self.promotion_sweep_task.cancel()
+        self.compact_daily_buckets.cancel()
+        self.demotion_sweep_task.cancel()
+        self.maintain_event_tables.cancel()
+        await self.vc_sessions.close_all()
+
+    def _current_voice_members(self) -> dict[int, int]:
+        """Returns {user_id: channel_id} for everyone currently connected to voice in the guild."""
+        guild = self.bot.get_guild(self.bot.guild_id)
+        if not guild:
+            return {}
+        return {
+            member.id: channel.id
+            for channel in guild.voice_channels + guild.stage_channels
+            for member in channel.members
+        }
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Closes sessions left over from the last run, then opens sessions for members already in voice."""
+        if not self._recovered_sessions:
+            await db.close_stale_vc_sessions()
+            self._recovered_sessions = True
+
+        # Also runs after reconnects, to catch joins and leaves missed while disconnected
+        await self.vc_sessions.reconcile(self._current_voice_members())
+
+    @tasks.loop(minutes=5)
+    async def checkpoint_vc_sessions(self):
+        """Credits VC time to everyone still connected and checks whether it earned them a promotion."""
+        guild = self.bot.get_guild(self.bot.guild_id)
+        if guild:
+            for user_id in list(self.vc_sessions.sessions):
+                member = guild.get_member(user_id)
+                if member:
+                    await self._check_promotion(member, refresh=True)
+
+        await self.vc_sessions.checkpoint_all()
+
+    @checkpoint_vc_sessions.before_loop
+    async def before_checkpoint_vc_sessions(self):
+        await self.bot.wait_until_ready()
+
+    async def _fetch_counters(self, member: discord.Member) -> dict:
+        """
+        Reads the counters the member's promotion rules need, including time in a still-open VC session
+        and the member's events still queued in the event writer (e.g. the message being checked).
+        """
+        windows = self.promotions.windows_for(member)
+        if not windows:
+            return {}
+        await db.sync_events()
+        counters = await db.fetch_activity_windows(member.id, windows)
+        live_minutes = self.vc_sessions.live_seconds(member.id) // 60
+        return {window: (message_count, vc_time + live_minutes) for window, (message_count, vc_time) in counters.items()}
+
+    async def _check_promotion(self, member: discord.Member, refresh: bool = False):
+        """
+        Promotes the member if they crossed one of their promotion thresholds.
+        With refresh=True (or for a member seen for the first time) the counters are re-read from the database.
+        """
+        # Check if the whole auto-promotion system is enabled
+        if not self.promotions.enabled:
             return
 
-        # Get the list of promotion rules
-        promotion_rules = self.config.get("promotions", [])
-    
-        # Get the user's current activity stats once
-        message_count, vc_time = await asyncio.to_thread(database.get_user_activity, member.id)
+        progress = self.promotions.progress.get(member.id)
+        if progress is None or refresh:
+            progress = self.promotions.observe(member, await self._fetch_counters(member))
+            refresh = True
 
-        # Loop through each rule in the config
-        for rule in promotion_rules:
-            source_role_id = int(rule.get("source_role_id", 0))
-            target_role_id = int(rule.get("target_role_id", 0))
+        # Nothing can have changed until a counter crosses a threshold
+        if not progress.due:
+            return
 
-            # Skip if IDs are missing
-            if not source_role_id or not target_role_id:
-                continue
+        # In-memory windowed counts never slide, so confirm them before acting on a crossing
+        if not refresh and self.promotions.needs_refresh(member):
+            progress = self.promotions.observe(member, await self._fetch_counters(member))
 
-            source_role = member.guild.get_role(source_role_id)
-            target_role = member.guild.get_role(target_role_id)
+        promotion = self.promotions.find_promotion(member, progress)
+        if not promotion:
+            return
 
-            # Skip if roles don't exist in the server
-            if not source_role or not target_role:
-                continue
+        rule, target_role = promotion
+        await self._promote(member, rule, target_role, progress)
+
+    async def _promote(self, member: discord.Member, rule, target_role: discord.Role, progress, lines: list = None) -> bool:
+        """
+        Gives the member the rule's role, dropping its toggled counterpart. Returns whether the role was added.
+        The promotion is logged as its own embed, or appended to `lines` for a summary when given.
+        """
+        # Only one promotion at a time: the new roles give the member a fresh set of rules on their next check
+        self.promotions.forget(member.id)
+        if target_role in member.roles:
+            return False
+
+        try:
+            removed_role = await toggle_role(self.bot, member, target_role, f"Automatic promotion: {rule.name}")
+        except discord.Forbidden:
+            print(Style.BRIGHT + Fore.RED + f"Failed to promote {member.name}: the bot lacks permissions to manage roles.")
+            return False
+        except discord.HTTPException as e:
+            print(Style.BRIGHT + Fore.RED + f"Failed to promote {member.name}: {e}")
+            return False
+
+        message_count, vc_time = progress.counts(rule.window_days)
+        window_text = f", last {rule.window_days} days" if rule.window_days else ""
+        counts = f"Messages: {message_count}, VC Time: {vc_time} mins{window_text}"
+        if lines is not None:
+            removed_text = f" (removed {removed_role.mention})" if removed_role else ""
+            lines.append(f"{member.mention}: {target_role.mention}{removed_text} — {rule.name} ({counts})")
+            return True
+
+        details = f"✅ Added Role: {target_role.mention}"
+        if removed_role:
+            details += f"\n❌ Removed Toggled Role: {removed_role.mention}"
+        await log_action(self.bot, "Automatic User Promotion", member, f"System ({counts})", details)
+        return True
+
+    def _last_seen(self, member: discord.Member, last_seen_by_user: dict) -> int | None:
+        """
+        When the member was last active, counting members never seen from when they joined.
+        None while they're in voice: still in voice means still active, whatever the last checkpoint says.
+        """
+        if member.id in self.vc_sessions:
+            return None
+        last_seen = last_seen_by_user.get(member.id)
+        if last_seen is None and member.joined_at:
+            last_seen = int(member.joined_at.timestamp())
+        return last_seen
+
+    async def run_promotion_sweep(self) -> str:
+        """
+        Checks every member of the guild against the promotion rules and applies what's due.
+        Counters for everyone come from one query; promotions are applied by a few workers
+        sharing a rate limiter. Returns a human-readable report.
+        """
+        guild = self.bot.get_guild(self.bot.guild_id)
+        if not guild:
+            return "Guild not found."
+
+        async with self._sweep_lock:
+            started = time.perf_counter()
+            # One grouped query per activity window the rules use
+            activity = {}
+            for window in self.promotions.windows:
+                if window is None:
+                    activity[window] = await db.fetch_all_activity()
+                else:
+                    activity[window] = await db.fetch_all_window_activity(window)
+            # Members the demotion sweep would take a promotion straight back from (see PromotionEngine)
+            last_seen_by_user = {}
+            if self.promotions.inactivity_cutoff_days is not None:
+                last_seen_by_user = await db.fetch_all_last_seen()
+
+            due = []
+            checked = 0
+            for member in guild.members:
+                if member.bot:
+                    continue
+                windows = self.promotions.windows_for(member)
+                if not windows:
+                    continue
+                checked += 1
+                live_minutes = self.vc_sessions.live_seconds(member.id) // 60
+                counters = {}
+                for window in windows:
+                    message_count, vc_time = activity[window].get(member.id, (0, 0))
+                    counters[window] = (message_count, vc_time + live_minutes)
+                progress = self.promotions.observe(member, counters)
+                promotion = self.promotions.find_promotion(member, progress, self._last_seen(member, last_seen_by_user))
+                if promotion:
+                    due.append((member, *promotion, progress))
+            evaluated = time.perf_counter()
+
+            # Apply the promotions, paced so a large sweep doesn't run into Discord's rate limits
+            limiter = RateLimiter(self.sweep_config.get("actions_per_second", 2), burst=5)
+            queue = asyncio.Queue()
+            for item in due:
+                queue.put_nowait(item)
+
+            per_rule = {}
+            lines = []
+            async def worker():
+                while not queue.empty():
+                    member, rule, target_role, progress = queue.get_nowait()
+                    async with limiter:
+                        promoted = await self._promote(member, rule, target_role, progress, lines)
+                    if promoted:
+                        per_rule[rule.name] = per_rule.get(rule.name, 0) + 1
+
+            await asyncio.gather(*(worker() for _ in range(self.sweep_config.get("workers", 2))))
+            finished = time.perf_counter()
+
+        # One summary for the whole sweep instead of an embed per member
+        if lines:
+            await log_summary(self.bot, "Automatic User Promotions", lines, "System (Promotion Sweep)")
+
+        report = (
+            f"Checked {checked} of {guild.member_count} members in {(evaluated - started) * 1000:.0f} ms, "
+            f"promoted {len(lines)} of {len(due)} due in {finished - evaluated:.1f} s."
+        )
+        for name, count in per_rule.items():
+            report += f"\n• {name}: {count}"
+        return report
+
+    @tasks.loop(hours=6)
+    async def promotion_sweep_task(self):
+        """The scheduled sweep, catching members who qualified while the bot was down or under changed thresholds."""
+        print(Style.DIM + Fore.YELLOW + "Running scheduled promotion sweep...")
+        report = await self.run_promotion_sweep()
+        print(Fore.CYAN + f"Promotion sweep finished. {report}")
+
+    @promotion_sweep_task.before_loop
+    async def before_promotion_sweep_task(self):
+        await self.bot.wait_until_ready()
 
-            # Check if the user is eligible for this specific promotion:
-            # 1. They must have the source role.
-            # 2. They must NOT already have the target role.
-            if source_role not in member.roles or target_role in member.roles:
+    async def run_demotion_sweep(self) -> str:
+        """
+        Demotes members who hold a demotion rule's role and haven't been active for its inactive_days.
+        Members never seen at all count as inactive since they joined. Demotions go through the
+        same toggle logic as promotions and are logged as one summary.
+        """
+        guild = self.bot.get_guild(self.bot.guild_id)
+        if not guild or not self.demotion_rules:
+            return "Nothing to do."
+
+        started = time.perf_counter()
+        now = int(time.time())
+        cutoffs = {rule.index: now - rule.inactive_days * 86400 for rule in self.demotion_rules}
+        demotable_role_ids = {rule.source_role_id for rule in self.demotion_rules}
+        last_seen_by_user = await db.fetch_all_last_seen()
+
+        due = []
+        checked = 0
+        for member in guild.members:
+            role_ids = {role.id for role in member.roles}
+            if member.bot or not role_ids & demotable_role_ids:
+                continue
+            checked += 1
+            last_seen = self._last_seen(member, last_seen_by_user)
+            if last_seen is None:
                 continue
+            for rule in self.demotion_rules:
+                if rule.source_role_id in role_ids and last_seen < cutoffs[rule.index]:
+                    source_role = guild.get_role(rule.source_role_id)
+                    target_role = guild.get_role(rule.target_role_id)
+                    if source_role and target_role:
+                        due.append((member, rule, source_role, target_role, last_seen))
+                    break
 
-            # Get the thresholds for this rule
-            msg_threshold = rule.get("message_threshold", 500)
-            vc_min_threshold = rule.get("vc_threshold_minutes", 600)
-            logic = rule.get("promotion_logic", "AND").upper()
+        limiter = RateLimiter(self.demotion_config.get("actions_per_second", 2), burst=5)
+        lines = []
+        for member, rule, source_role, target_role, last_seen in due:
+            try:
+                async with limiter:
+                    reason = f"Automatic demotion: {rule.name}"
+                    # member.roles isn't updated by the requests below, so track the change here
+                    roles = set(member.roles)
+                    if target_role not in roles:
+                        roles.add(target_role)
+                        roles.discard(await toggle_role(self.bot, member, target_role, reason))
+                    # The toggle normally takes the old role away; make sure it's gone either way
+                    if source_role in roles:
+                        await member.remove_roles(source_role, reason=reason)
+                lines.append(f"{member.mention}: {source_role.mention} → {target_role.mention} (last active <t:{last_seen}:R>)")
+            except discord.HTTPException as e:
+                print(Style.BRIGHT + Fore.RED + f"Failed to demote {member.name}: {e}")
 
-            # Check if the user meets the thresholds
-            met_messages = message_count >= msg_threshold
-            met_vc_time = vc_time >= vc_min_threshold
-        
-            should_promote = (logic == "AND" and met_messages and met_vc_time) or \
-                             (logic == "OR" and (met_messages or met_vc_time))
-
-            if should_promote:
-                # If they meet the criteria, promote them
-                await handle_role_add(
-                    bot=self.bot,
-                    member=member,
-                    role_to_add=target_role,
-                    reason=f"Automatic promotion: {rule.get('name', 'N/A')}",
-                    log_title="Automatic User Promotion",
-                    log_responsible_party=f"System (Messages: {message_count}, VC Time: {vc_time} mins)"
-                )
-                # Stop checking after a successful promotion to avoid multiple promotions at once
-                break 
+        if lines:
+            await log_summary(self.bot, "Inactivity Demotions", lines, "System (Automatic)")
+
+        return (
+            f"Checked {checked} members holding demotable roles, demoted {len(lines)} "
+            f"in {time.perf_counter() - started:.1f} s."
+        )
+
+    @tasks.loop(hours=24)
+    async def demotion_sweep_task(self):
+        print(Style.DIM + Fore.YELLOW + "Running scheduled demotion sweep...")
+        report = await self.run_demotion_sweep()
+        print(Fore.CYAN + f"Demotion sweep finished. {report}")
+
+    @demotion_sweep_task.before_loop
+    async def before_demotion_sweep_task(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=24)
+    async def compact_daily_buckets(self):
+        """Drops daily activity buckets that no windowed rule can reach anymore."""
+        removed = await db.compact_daily_activity(self.daily_bucket_days)
+        if removed:
+            print(Style.DIM + Fore.YELLOW + f"Compacted {removed} daily activity buckets older than {self.daily_bucket_days} days.")
+
+    @tasks.loop(minutes=60)
+    async def maintain_event_tables(self):
+        """Rolls raw events up into hourly/daily counts and prunes the raw rows past their retention."""
+        report = await rollups.run_retention(self.retention_config)
+        if report["rolled_up"] or report["pruned"] or report["packed"]:
+            print(
+                Style.DIM + Fore.YELLOW + f"Rolled up {report['rolled_up']} events, pruned {report['pruned']} rows, "
+                f"packed {report['packed']} archived rows ({report['free_pages']} free pages left)."
+            )
+
+    @promotions_group.command(name="sweep", description="Checks every member for due promotions right now.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def promotions_sweep(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        if not self.promotions.enabled:
+            await interaction.followup.send("Auto-promotion is disabled in the config.", ephemeral=True)
+            return
+
+        report = await self.run_promotion_sweep()
+        await interaction.followup.send(f"✅ Promotion sweep finished.\n{report}", ephemeral=True)
+
+    @promotions_group.command(name="demote-inactive", description="Runs the inactivity demotion rules right now.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def promotions_demote_inactive(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        if not self.demotion_rules:
+            await interaction.followup.send("No demotion rules are configured.", ephemeral=True)
+            return
+
+        report = await self.run_demotion_sweep()
+        await interaction.followup.send(f"✅ Demotion sweep finished.\n{report}", ephemeral=True)
+
+    @promotions_group.command(name="simulate", description="Shows who a candidate set of promotion rules would promote.")
+    @app_commands.describe(rules="A YAML file with the candidate promotion rules (same format as config.yaml).")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def promotions_simulate(self, interaction: discord.Interaction, rules: discord.Attachment):
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            rules_data = yaml.safe_load((await rules.read()).decode("utf-8"))
+            # Runs on a snapshot copy of the database, never the live file
+            user_count, results = await asyncio.to_thread(simulator.run_simulation, database.DB_FILE, rules_data)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Simulation failed! Reason: {e}", ephemeral=True)
+            return
+
+        if not results:
+            await interaction.followup.send("No valid promotion rules found in that file.", ephemeral=True)
+            return
+
+        summary = f"🧪 Evaluated {user_count} users against {len(results)} rules:"
+        details = []
+        for name, user_ids in results.items():
+            summary += f"\n• **{name}**: {len(user_ids)} would be promoted"
+            details.append(f"{name} ({len(user_ids)})")
+            details.extend(f"  {user_id}" for user_id in user_ids)
+
+        # The full member list goes in an attachment, it easily outgrows a message
+        report_file = discord.File(io.BytesIO("\n".join(details).encode("utf-8")), filename="simulation.txt")
+        await interaction.followup.send(summary, file=report_file, ephemeral=True)
+
+    @app_commands.command(name="rebuild-activity-db", description="Recomputes every member's activity counters from the raw event history.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def rebuild_activity(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            user_count = await db.rebuild_user_activity()
+        except Exception as e:
+            await interaction.followup.send(f"❌ Rebuild failed! Reason: {e}", ephemeral=True)
+            return
+
+        await interaction.followup.send(f"✅ Rebuilt activity counters for {user_count} users.", ephemeral=True)
 
     # ... (on_message and on_voice_state_update are unchanged)
     @commands.Cog.listener()
@@ -79,35 +438,52 @@ class ActivityTrackerCog(commands.Cog):
         if message.author.bot or not message.guild or message.content.startswith('/'): 
             return
         
-        await asyncio.to_thread(database.log_message, message.author.id, message.channel.id)
+        await db.log_message(message.author.id, message.channel.id, message.id)
+        self.promotions.count_message(message.author.id)
         await self._check_promotion(message.author)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
-        # Log a "join" event
+        now = int(time.time())
+
+        # Log a "join" event and open a session
         if before.channel is None and after.channel is not None:
-            await asyncio.to_thread(database.log_vc_event, member.id, after.channel.id, "join")
+            await db.log_vc_event(member.id, after.channel.id, "join")
+            await self.vc_sessions.open(member.id, after.channel.id, now)
 
-        # Log a "leave" event
+        # Log a "leave" event, then close the session (the check still sees its live time)
         elif before.channel is not None and after.channel is None:
-            await asyncio.to_thread(database.log_vc_event, member.id, before.channel.id, "leave")
-            await self._check_promotion(member)
+            await db.log_vc_event(member.id, before.channel.id, "leave")
+            await self._check_promotion(member, refresh=True)
+            await self.vc_sessions.close(member.id, now)
+
+        # Log a channel move and continue in a new session for the new channel
+        elif before.channel is not None and after.channel is not None and before.channel.id != after.channel.id:
+            await db.log_vc_event(member.id, after.channel.id, "move")
+            await self.vc_sessions.move(member.id, after.channel.id, now)
 
         # ▼▼▼ EXPANDED LOGIC FOR VOICE STATES ▼▼▼
         elif before.channel is not None and after.channel is not None:
             channel = after.channel # or before.channel, they are the same here
             if before.self_mute != after.self_mute:
                 event = "mute" if after.self_mute else "unmute"
-                await asyncio.to_thread(database.log_voice_state_event, member.id, channel.id, event)
+                await db.log_voice_state_event(member.id, channel.id, event)
             elif before.self_deaf != after.self_deaf:
                 event = "deafen" if after.self_deaf else "undeafen"
-                await asyncio.to_thread(database.log_voice_state_event, member.id, channel.id, event)
+                await db.log_voice_state_event(member.id, channel.id, event)
             elif before.self_stream != after.self_stream:
                 event = "stream_start" if after.self_stream else "stream_stop"
-                await asyncio.to_thread(database.log_voice_state_event, member.id, channel.id, event)
+                await db.log_voice_state_event(member.id, channel.id, event)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        """A role change means a different set of promotion rules applies to the member."""
+        if before.roles != after.roles:
+            self.promotions.forget(after.id)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
+        join_wave = self.bot.join_pipeline.observe(member)
         if not self.config.get("enabled", False): return
         source_role_id = int(self.config.get("source_role_id", 0))
         if not source_role_id: return
@@ -115,6 +491,11 @@ class ActivityTrackerCog(commands.Cog):
         if not role:
             print(Style.BRIGHT + Fore.RED + f"Error: Auto-assign role with ID {source_role_id} not found.")
             return
+
+        # During a join wave the autorole goes out with the member's other roles, in one queued request
+        if join_wave:
+            self.bot.join_pipeline.submit(member, [role], "new member autorole", toggle=True)
+            return
         
         # ▼▼▼ CONSOLIDATED LOGGING CALL ▼▼▼
         await handle_role_add(
@@ -133,7 +514,7 @@ class ActivityTrackerCog(commands.Cog):
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
         if before.author.bot or not before.guild or before.content == after.content:
             return
-        await asyncio.to_thread(database.log_message_event, 
+        await db.log_message_event(
             before.id, before.author.id, before.channel.id, "edit", content=before.content
         )
 
@@ -142,7 +523,7 @@ class ActivityTrackerCog(commands.Cog):
     async def on_message_delete(self, message: discord.Message):
         if message.author.bot or not message.guild:
             return
-        await asyncio.to_thread(database.log_message_event, 
+        await db.log_message_event(
             message.id, message.author.id, message.channel.id, "delete"
         )
     
@@ -151,7 +532,7 @@ class ActivityTrackerCog(commands.Cog):
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.Member):
         if user.bot or not reaction.message.guild:
             return
-        await asyncio.to_thread(database.log_reaction, 
+        await db.log_reaction(
             user.id, reaction.message.channel.id, reaction.message.id, reaction.emoji, "add"
         )
 
@@ -159,7 +540,7 @@ class ActivityTrackerCog(commands.Cog):
     async def on_reaction_remove(self, reaction: discord.Reaction, user: discord.Member):
         if user.bot or not reaction.message.guild:
             return
-        await asyncio.to_thread(database.log_reaction, 
+        await db.log_reaction(
             user.id, reaction.message.channel.id, reaction.message.id, reaction.emoji, "remove"
         )
 
@@ -0,0 +1,62 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+from utils import database
+from utils.backfill import BackfillProgress, backfill_channels, run_backfill
+from utils.db import db
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class BackfillCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.config = bot.config.get("backfill", {})
+        self._lock = asyncio.Lock()
+
+    @app_commands.command(name="backfill", description="Imports old channel history into the activity database.")
+    @app_commands.describe(channel="Only backfill this channel", restart="Forget saved progress and rescan from the oldest counted message")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def backfill(self, interaction: discord.Interaction, channel: discord.TextChannel = None, restart: bool = False):
+        if self._lock.locked():
+            await interaction.response.send_message("A backfill is already running.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        async with self._lock:
+            channels = backfill_channels(interaction.guild, {channel.id} if channel else None)
+            if restart:
+                for target in channels:
+                    await db.run_write(database.reset_backfill_state, target.id)
+
+            progress = BackfillProgress(len(channels))
+            status = await interaction.followup.send(f"⏳ Backfill started: {progress.summary()}", ephemeral=True, wait=True)
+
+            task = asyncio.create_task(run_backfill(
+                channels, progress, self.config.get("requests_per_second", 4), self.config.get("workers", 3)
+            ))
+            try:
+                # Progress edits until the backfill finishes
+                while not task.done():
+                    await asyncio.wait({task}, timeout=self.config.get("progress_interval_seconds", 15))
+                    if not task.done():
+                        await self._edit_status(status, f"⏳ Backfilling: {progress.summary()}")
+            finally:
+                # The lock stays held until the backfill has really stopped
+                await task
+
+            failed = f"\nFailed: {', '.join(f'#{target.name}' for target in progress.failed_channels)}" if progress.failed_channels else ""
+            await self._edit_status(status, f"✅ Backfill finished: {progress.summary()}{failed}")
+            print(Fore.CYAN + f"Backfill finished: {progress.summary()}{failed}")
+
+    @staticmethod
+    async def _edit_status(status: discord.WebhookMessage, content: str):
+        # The interaction token expires after 15 minutes, long before a big backfill is done
+        try:
+            await status.edit(content=content)
+        except discord.HTTPException:
+            print(Fore.CYAN + content)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(BackfillCog(bot))
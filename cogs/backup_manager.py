@@ -8,6 +8,8 @@ import sqlite3
 import asyncio
 from datetime import datetime
 from utils.database import DB_FILE # This ensures we target the correct shared file
+from utils import database
+from utils.db import db
 colorama.init(autoreset=True)
 
 class BackupManagerCog(commands.Cog):
@@ -102,6 +104,17 @@ class BackupManagerCog(commands.Cog):
         else:
             await interaction.followup.send(f"❌ Backup failed! Reason: {message}", ephemeral=True)
 
+    @app_commands.command(name="db-stats", description="Shows database call latencies and write queue stats.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def db_stats(self, interaction: discord.Interaction):
+        lines = db.latency_report() or ["No database calls yet."]
+        lines.append(
+            f"Event writer: {database.writer.events_written} events in {database.writer.batches_written} batches, "
+            f"{database.writer.pending} pending, {database.writer.events_dropped} dropped, "
+            f"{database.connections.busy_retries} busy retries"
+        )
+        await interaction.response.send_message("```\n" + "\n".join(lines)[:1900] + "\n```", ephemeral=True)
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(BackupManagerCog(bot))
\ No newline at end of file
@@ -0,0 +1,70 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import os
+import time
+from pathlib import Path
+from utils.export import EXPORT_TABLES, FORMATS, export_activity, export_filename, parse_date
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class ExportCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.config = bot.config.get("export", {})
+        self.export_folder = Path(self.config.get("export_folder", "./exports"))
+
+    @app_commands.command(name="export-activity", description="Exports raw activity for a date range as a compressed file.")
+    @app_commands.describe(
+        since="First day included (YYYY-MM-DD, UTC)",
+        until="Day the export stops before (YYYY-MM-DD, UTC; default: now)",
+        user="Only this member's activity",
+        table="Only this kind of activity (default: all)",
+        format="File format (default: CSV)"
+    )
+    @app_commands.choices(
+        table=[app_commands.Choice(name=table, value=table) for table in EXPORT_TABLES],
+        format=[app_commands.Choice(name=fmt.upper(), value=fmt) for fmt in FORMATS]
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def export_activity(self, interaction: discord.Interaction, since: str, until: str = None, user: discord.User = None,
+                              table: app_commands.Choice[str] = None, format: app_commands.Choice[str] = None):
+        try:
+            since_ts = parse_date(since)
+            until_ts = parse_date(until) if until else int(time.time())
+        except ValueError:
+            await interaction.response.send_message("Dates must look like `2025-01-31`.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        fmt = format.value if format else "csv"
+        user_id = user.id if user else None
+        os.makedirs(self.export_folder, exist_ok=True)
+        out_path = self.export_folder / export_filename(since_ts, until_ts, fmt, user_id)
+
+        try:
+            counts = await asyncio.to_thread(
+                export_activity, out_path, since_ts, until_ts, user_id, [table.value] if table else None, fmt
+            )
+        except Exception as e:
+            out_path.unlink(missing_ok=True)
+            await interaction.followup.send(f"❌ Export failed! Reason: {e}", ephemeral=True)
+            return
+
+        summary = "📦 Exported " + ", ".join(f"{count:,} {name}" for name, count in counts.items())
+        size = out_path.stat().st_size
+        if size <= interaction.guild.filesize_limit:
+            await interaction.followup.send(summary, file=discord.File(out_path), ephemeral=True)
+            out_path.unlink()
+        else:
+            # Too big for an attachment; it stays on the server for whoever has file access
+            await interaction.followup.send(
+                f"{summary}\nThe file is {size / 1024 / 1024:.1f} MB, over the upload limit, so it was kept at `{out_path}`.",
+                ephemeral=True
+            )
+        print(Fore.CYAN + f"Activity export {out_path.name} ({size / 1024:,.1f} KiB) requested by {interaction.user}.")
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(ExportCog(bot))
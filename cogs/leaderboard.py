@@ -0,0 +1,153 @@
+import discord
+from discord.ext import commands, tasks
+from discord import app_commands
+import time
+from utils.cache import TTLCache
+from utils.connections import QueryTimeout
+from utils.database import LEADERBOARD_PERIODS
+from utils.db import db
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+METRICS = {
+    "messages": "💬 Messages",
+    "voice": "🎙 Voice Time",
+    "reactions": "⭐ Reactions Given",
+}
+
+BUSY_MESSAGE = "The leaderboard is busy right now, try again in a moment."
+
+def format_score(metric: str, score: int) -> str:
+    if metric == "voice":
+        hours, minutes = divmod(score // 60, 60)
+        return f"{hours}h {minutes:02d}m"
+    return f"{score:,}"
+
+class LeaderboardView(discord.ui.View):
+    """Previous/Next buttons that walk the ranking with keyset cursors instead of offsets."""
+
+    def __init__(self, cog: "LeaderboardCog", owner_id: int, metric: str, period: str):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.owner_id = owner_id
+        self.metric = metric
+        self.period = period
+        # Cursor each visited page starts after; page 0 starts at the top
+        self.cursors = [None]
+        self.rows = []
+        self.has_next = False
+
+    @property
+    def page(self) -> int:
+        return len(self.cursors) - 1
+
+    async def load(self):
+        rows = await self.cog.get_page(self.metric, self.period, self.cursors[-1])
+        # One extra row tells us whether there's a next page
+        self.has_next = len(rows) > self.cog.page_size
+        self.rows = rows[:self.cog.page_size]
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not self.has_next
+
+    def build_embed(self, guild: discord.Guild) -> discord.Embed:
+        first_rank = self.page * self.cog.page_size + 1
+        lines = []
+        for rank, (user_id, score) in enumerate(self.rows, start=first_rank):
+            member = guild.get_member(user_id)
+            name = member.mention if member else f"<@{user_id}>"
+            lines.append(f"**{rank}.** {name} — {format_score(self.metric, score)}")
+
+        embed = discord.Embed(
+            title=f"{METRICS[self.metric]} Leaderboard ({self.period})",
+            description="\n".join(lines) or "Nobody here yet.",
+            color=discord.Color.gold()
+        )
+        embed.set_footer(text=f"Page {self.page + 1} • Updated every {self.cog.refresh_minutes} minutes")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Run /leaderboard yourself to browse it.", ephemeral=True)
+            return False
+        return True
+
+    async def turn_page(self, interaction: discord.Interaction, cursors: list):
+        """Shows the page after cursors[-1]; on a query timeout the view stays where it was."""
+        # A page that isn't cached can take longer than the 3 s Discord gives to respond
+        await interaction.response.defer()
+        previous = self.cursors
+        self.cursors = cursors
+        try:
+            await self.load()
+        except QueryTimeout:
+            self.cursors = previous
+            await interaction.followup.send(BUSY_MESSAGE, ephemeral=True)
+            return
+        await interaction.edit_original_response(embed=self.build_embed(interaction.guild), view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn_page(interaction, self.cursors[:-1])
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        user_id, score = self.rows[-1]
+        await self.turn_page(interaction, self.cursors + [(score, user_id)])
+
+class LeaderboardCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.config = bot.config.get("leaderboard", {})
+        self.page_size = self.config.get("page_size", 10)
+        self.refresh_minutes = self.config.get("refresh_minutes", 15)
+        # Pages are keyed by (metric, period, cursor); cleared whenever the rankings are rebuilt
+        self.pages = TTLCache(maxsize=512, ttl=self.config.get("cache_seconds", 60))
+
+        self.refresh_rankings.change_interval(minutes=self.refresh_minutes)
+        self.refresh_rankings.start()
+
+    def cog_unload(self):
+        self.refresh_rankings.cancel()
+
+    async def get_page(self, metric: str, period: str, after: tuple = None) -> list[tuple[int, int]]:
+        key = (metric, period, after)
+        rows = self.pages.get(key)
+        if rows is None:
+            rows = await db.fetch_leaderboard_page(metric, period, after, self.page_size + 1)
+            self.pages.put(key, rows)
+        return rows
+
+    @tasks.loop(minutes=15)
+    async def refresh_rankings(self):
+        """Recomputes every ranking, one short transaction per (metric, period)."""
+        started = time.perf_counter()
+        for metric in METRICS:
+            for period in LEADERBOARD_PERIODS:
+                await db.rebuild_leaderboard(metric, period)
+        self.pages.clear()
+        print(Style.DIM + Fore.YELLOW + f"Leaderboards refreshed in {time.perf_counter() - started:.2f} s.")
+
+    @refresh_rankings.before_loop
+    async def before_refresh_rankings(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="leaderboard", description="Shows the most active members.")
+    @app_commands.describe(metric="What to rank by", period="How far back to count (default: all time)")
+    @app_commands.choices(
+        metric=[app_commands.Choice(name=label, value=metric) for metric, label in METRICS.items()],
+        period=[app_commands.Choice(name=period.title(), value=period) for period in LEADERBOARD_PERIODS]
+    )
+    async def leaderboard(self, interaction: discord.Interaction, metric: app_commands.Choice[str], period: app_commands.Choice[str] = None):
+        # Deferred first: a page that isn't cached can take longer than the 3 s Discord gives to respond
+        await interaction.response.defer()
+        view = LeaderboardView(self, interaction.user.id, metric.value, period.value if period else "all")
+        try:
+            await view.load()
+        except QueryTimeout:
+            await interaction.edit_original_response(content=BUSY_MESSAGE)
+            return
+        await interaction.followup.send(embed=view.build_embed(interaction.guild), view=view)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(LeaderboardCog(bot))
@@ -1,11 +1,12 @@
 ﻿import discord
 import asyncio
+import time
 from discord.ext import commands
 from discord import app_commands
 # We no longer need to import log_action here
 from utils.logger import log_action
-from utils.role_utils import handle_role_add 
-from utils import database
+from utils.role_utils import handle_role_add, is_moderator
+from utils.db import db
 
 class ManualRolesCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -13,15 +14,6 @@ class ManualRolesCog(commands.Cog):
 
     role_group = app_commands.Group(name="role", description="Manual role management for moderators.")
 
-    def is_moderator(self, interaction: discord.Interaction) -> bool:
-        mod_role_id = int(self.bot.config.get("mod_role_id", 0))
-        mod_role = interaction.guild.get_role(mod_role_id)
-        if interaction.user.guild_permissions.administrator:
-            return True
-        if mod_role and mod_role in interaction.user.roles:
-            return True
-        return False
-
     @app_commands.command(name="ping", description="Check the bot's latency.")
     async def ping(self, interaction: discord.Interaction):
         # We don't defer here because we want to measure the raw speed
@@ -34,29 +26,54 @@ class ManualRolesCog(commands.Cog):
         await interaction.response.defer(ephemeral=True)
     
         guild = interaction.guild
-        member_count = 0
-    
-        # Loop through every member in the server
-        for member in guild.members:
-            if member.bot:
-                continue
-            
-            # Get their current roles
-            current_role_ids = [str(role.id) for role in member.roles if role.name != "@everyone"]
-        
-            # Save them to the database
-            if current_role_ids:
-                await asyncio.to_thread(database.update_user_roles, member.id, current_role_ids)
+        members = [member for member in guild.members if not member.bot]
+        chunk_size = self.bot.config.get("role_rebuild", {}).get("chunk_size", 1000)
+        status = await interaction.followup.send(f"⏳ Scanning {len(members)} members...", ephemeral=True, wait=True)
+
+        # The stored roles of everyone in one query; only the differences are written back
+        stored = await db.fetch_all_user_roles()
+        member_count = changed_count = 0
+        added_total = removed_total = 0
+        last_edit = time.monotonic()
+
+        for start in range(0, len(members), chunk_size):
+            added, removed = [], []
+            for member in members[start:start + chunk_size]:
+                # Get their current roles (members without any keep what's stored, for when they come back)
+                current_role_ids = {role.id for role in member.roles if role.name != "@everyone"}
+                if not current_role_ids:
+                    continue
                 member_count += 1
-                
-        await interaction.followup.send(f"✅ Successfully scanned and saved roles for {member_count} members.")
+
+                saved_role_ids = stored.get(member.id, set())
+                added += [(member.id, role_id) for role_id in current_role_ids - saved_role_ids]
+                removed += [(member.id, role_id) for role_id in saved_role_ids - current_role_ids]
+                if current_role_ids != saved_role_ids:
+                    changed_count += 1
+
+            # One short transaction per chunk, so live role updates keep getting through in between
+            if added or removed:
+                await db.apply_role_diffs(added, removed)
+            added_total += len(added)
+            removed_total += len(removed)
+
+            done = min(start + chunk_size, len(members))
+            if done < len(members) and time.monotonic() - last_edit > 2:
+                await status.edit(content=f"⏳ Scanned {done}/{len(members)} members, {changed_count} changed so far...")
+                last_edit = time.monotonic()
+            await asyncio.sleep(0)
+
+        await status.edit(content=(
+            f"✅ Successfully scanned and saved roles for {member_count} members.\n"
+            f"{changed_count} members changed ({added_total} roles added, {removed_total} removed); the rest were already up to date."
+        ))
 
     @role_group.command(name="add", description="Add a role to a user.")
     @app_commands.describe(user="The user to add the role to.", role="The role to add.", reason="Why you do like that?")
     async def add_role(self, interaction: discord.Interaction, user: discord.Member, role: discord.Role, reason: str = None):
         await interaction.response.defer(ephemeral=True)
 
-        if not self.is_moderator(interaction):
+        if not is_moderator(self.bot, interaction):
             await interaction.followup.send("You don't have permission to use this command.", ephemeral=True)
             return
 
@@ -75,8 +92,7 @@ class ManualRolesCog(commands.Cog):
             if reason:
                 source_text += f" - Reason: {reason}"
 
-            await asyncio.to_thread(
-                database.log_role_change,
+            await db.log_role_change(
                 user_id=user.id,
                 role_id=role.id,
                 action="added",
@@ -105,7 +121,7 @@ class ManualRolesCog(commands.Cog):
     async def remove_role(self, interaction: discord.Interaction, user: discord.Member, role: discord.Role, reason: str = None):
         await interaction.response.defer(ephemeral=True)
 
-        if not self.is_moderator(interaction):
+        if not is_moderator(self.bot, interaction):
             await interaction.followup.send("You don't have permission to use this command.", ephemeral=True)
             return
             
@@ -125,8 +141,7 @@ class ManualRolesCog(commands.Cog):
             if reason:
                 source_text += f" - Reason: {reason}"
             
-            await asyncio.to_thread(
-                database.log_role_change,
+            await db.log_role_change(
                 user_id=user.id,
                 role_id=role.id,
                 action="removed",
@@ -1,9 +1,11 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
-import yaml
 import colorama
-from utils import database # Make sure your database functions are accessible
+from utils.db import db
+from utils.audit_log import AuditLogCorrelator
+from utils.role_batch import RoleUpdateBatcher
+from utils.known_users import KnownUsersIndex
 from colorama import Fore, Style, init
 
 from utils.logger import log_action
@@ -12,6 +14,39 @@ colorama.init(autoreset=True)
 class RolePersistenceCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        history_config = bot.config.get("role_history", {})
+        # Who changed a member's roles comes from audit log entries pushed over the gateway
+        self.audit_log = AuditLogCorrelator(
+            ttl=history_config.get("audit_ttl_seconds", 30),
+            timeout=history_config.get("audit_wait_seconds", 3)
+        )
+        # Role set and history rows are saved together, with quick successive updates coalesced
+        self.role_updates = RoleUpdateBatcher(db.apply_role_update, window=history_config.get("coalesce_seconds", 0.5))
+
+        # Known users are indexed once and rebuilt only when config.yaml changes
+        self.known_users = KnownUsersIndex("config.yaml", bot.config)
+        self.reload_known_users.change_interval(seconds=bot.config.get("known_users", {}).get("reload_seconds", 30))
+        self.reload_known_users.start()
+
+    async def cog_unload(self):
+        self.reload_known_users.cancel()
+        await self.role_updates.close()
+
+    @tasks.loop(seconds=30)
+    async def reload_known_users(self):
+        await asyncio.to_thread(self.known_users.reload_if_changed)
+
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
+        if entry.action == discord.AuditLogAction.member_role_update and entry.target is not None:
+            self.audit_log.record(entry)
+
+    def _describe_source(self, entry: discord.AuditLogEntry) -> str:
+        if entry is None:
+            return "Unknown"
+        if entry.user_id == self.bot.user.id:
+            return f"System ({entry.reason or 'Automatic'})"
+        return f"Moderator (<@{entry.user_id}>)"
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
@@ -22,109 +57,89 @@ class RolePersistenceCog(commands.Cog):
         if before.roles == after.roles:
             return
 
-        # --- Update the current set of roles for the user ---
-        # Get a list of all current role IDs as strings
-        current_role_ids = [str(role.id) for role in after.roles if role.name != "@everyone"]
-        await asyncio.to_thread(database.update_user_roles, after.id, current_role_ids)
-
-        # --- Determine what changed and log it to history ---
+        # --- Determine what changed ---
         before_roles = set(before.roles)
         after_roles = set(after.roles)
 
         added_roles = after_roles - before_roles
         removed_roles = before_roles - after_roles
-        
-        # We need a small delay to ensure the audit log is populated
-        await asyncio.sleep(2)
-        
-        # Determine the source of the change from the audit log
-        source = "Unknown"
-        try:
-            async for entry in after.guild.audit_logs(limit=5, action=discord.AuditLogAction.member_role_update):
-                # Find the specific log entry for this member
-                if entry.target.id == after.id:
-                    if entry.user.id == self.bot.user.id:
-                        source = f"System ({entry.reason or 'Automatic'})"
-                    else:
-                        source = f"Moderator ({entry.user.mention})"
-                    break # Stop after finding the relevant entry
-        except discord.Forbidden:
-            source = "Source Unknown (Missing Audit Log Permissions)"
 
-        # Log added roles
-        for role in added_roles:
-            await asyncio.to_thread(database.log_role_change, user_id=after.id, role_id=role.id, action="added", source=source)
+        # --- Update the current set of roles for the user ---
+        # Recorded in gateway order; written (only the difference to what's stored) with the history below
+        current_role_ids = [role.id for role in after.roles if role.name != "@everyone"]
+        self.role_updates.begin(after.id, current_role_ids)
 
-        # Log removed roles
-        for role in removed_roles:
-            await asyncio.to_thread(database.log_role_change, user_id=after.id, role_id=role.id, action="removed", source=source)
+        source = "Unknown"
+        try:
+            # Determine the source of the change from the matching audit log entry
+            # (audit log events are only delivered to bots that can view the audit log)
+            if after.guild.me.guild_permissions.view_audit_log:
+                entry = await self.audit_log.resolve(
+                    after.id, {role.id for role in added_roles}, {role.id for role in removed_roles}
+                )
+                source = self._describe_source(entry)
+            else:
+                source = "Source Unknown (Missing Audit Log Permissions)"
+        finally:
+            # Always finished, or the member's batch would wait for this update forever
+            self.role_updates.finish(after.id, [role.id for role in added_roles], [role.id for role in removed_roles], source)
 
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
         """
         Checks if a returning member has saved roles and re-applies them.
+        During a join wave the roles are handed to the join pipeline instead (queued, one summary log).
         """
-        known_users = yaml.safe_load(open("config.yaml", "r", encoding="UTF-8")).get("known_users")
-        known_ogs = known_users.get("known_ogs", [])
-        known_ogs = [item['id'] for item in known_ogs]
-        known_trolls = known_users.get("known_trolls", [])
-        known_trolls = [item['id'] for item in known_trolls]
-        og = member.guild.get_role(1404606604795449364)
-        troll = member.guild.get_role(1420533874513018960)
+        join_wave = self.bot.join_pipeline.observe(member)
+        known_users = self.known_users.current
         roles_to_add = []
+        note = None
         
-        saved_roles = await asyncio.to_thread(database.get_user_roles, member.id)
+        saved_roles = await db.fetch_user_roles(member.id)
         # Path A: User has NO saved roles (they are a new member).
         if not saved_roles:
             # Check if this new member is a pre-approved OG.
-            if member.id in known_ogs:
-                roles_to_add.append(og)
+            if member.id in known_users.ogs:
+                roles_to_add.append(member.guild.get_role(known_users.og_role_id))
+                note = "known OG"
                 print(Style.BRIGHT + Fore.LIGHTCYAN_EX + f"A new OG has joined the server: {member.name}")
-                await log_action(
-                    bot=self.bot,
-                    title="Known User:",
-                    target_user=member,
-                    responsible_party="<@1403454465268252723>", # Use the moderator who ran the command
-                    details=f"Role: {roles_to_add}"
-                )
-            else:
-                if member.id in known_trolls:
-                    roles_to_add.append(troll)
-                    print(Style.BRIGHT + Fore.LIGHTYELLOW_EX + f"A known troll has joined the server: {member.name}")
-                    await log_action(
-                        bot=self.bot,
-                        title="Known User:",
-                        target_user=member,
-                        responsible_party="<@1403454465268252723>", # Use the moderator who ran the command
-                        details=f"Role: {roles_to_add}"
-                    )
+            elif member.id in known_users.trolls:
+                roles_to_add.append(member.guild.get_role(known_users.troll_role_id))
+                note = "known troll"
+                print(Style.BRIGHT + Fore.LIGHTYELLOW_EX + f"A known troll has joined the server: {member.name}")
 
         # Path B: User HAS saved roles (they are a returning member).
-        # The 'if' block above is skipped, and the code continues here.
         else:
-            for role_id_str in saved_roles:
-                role = member.guild.get_role(int(role_id_str))
+            for role_id in saved_roles:
+                role = member.guild.get_role(role_id)
                 if role and not role.is_bot_managed() and role < member.guild.me.top_role:
                     roles_to_add.append(role)
-                    print(Style.BRIGHT + Fore.CYAN + f"A prodigal user has returned: {member.name}")
-                    await log_action(
-                        bot=self.bot,
-                        title="Known User:",
-                        target_user=member,
-                        responsible_party="<@1403454465268252723>", # Use the moderator who ran the command
-                        details=f"Roles: {roles_to_add}"
-                    )
+            note = "returning member"
+            print(Style.BRIGHT + Fore.CYAN + f"A prodigal user has returned: {member.name}")
 
-        
-        if roles_to_add:
-            try:
-                await member.add_roles(*roles_to_add, reason="Automatic role restoration for returning member.")
-                print(Style.BRIGHT + Fore.LIGHTYELLOW_EX + f"Restored {len(roles_to_add)} roles for returning member {member.name}.")
-            except discord.Forbidden:
-                print(Style.BRIGHT + Fore.LIGHTRED_EX + f"Failed to restore roles for {member.name} due to missing permissions.")
-            except discord.HTTPException as e:
-                print(Style.BRIGHT + Fore.LIGHTRED_EX + f"An error occurred while restoring roles for {member.name}: {e}")
+        roles_to_add = [role for role in roles_to_add if role]
+        if not roles_to_add:
+            return
+
+        if join_wave:
+            self.bot.join_pipeline.submit(member, roles_to_add, note)
+            return
+
+        await log_action(
+            bot=self.bot,
+            title="Known User:",
+            target_user=member,
+            responsible_party=known_users.logged_as,
+            details=f"Roles: {roles_to_add}"
+        )
+        try:
+            await member.add_roles(*roles_to_add, reason="Automatic role restoration for returning member.")
+            print(Style.BRIGHT + Fore.LIGHTYELLOW_EX + f"Restored {len(roles_to_add)} roles for returning member {member.name}.")
+        except discord.Forbidden:
+            print(Style.BRIGHT + Fore.LIGHTRED_EX + f"Failed to restore roles for {member.name} due to missing permissions.")
+        except discord.HTTPException as e:
+            print(Style.BRIGHT + Fore.LIGHTRED_EX + f"An error occurred while restoring roles for {member.name}: {e}")
     
 async def setup(bot: commands.Bot):
     await bot.add_cog(RolePersistenceCog(bot))
\ No newline at end of file
@@ -0,0 +1,91 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+from utils.db import db
+from utils.promotions import PromotionEngine
+from utils.role_utils import is_moderator
+
+def progress_bar(value: int, target: int, width: int = 10) -> str:
+    filled = min(width, value * width // target) if target else width
+    return "█" * filled + "░" * (width - filled)
+
+def format_minutes(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+class StatsCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # Only used to find a member's candidate rules; progress itself comes from the stats profile
+        self.promotions = PromotionEngine(bot.config.get("auto_promotion", {}))
+
+    def _live_vc_seconds(self, user_id: int) -> int:
+        """VC time from an open session that hasn't been checkpointed to the database yet."""
+        tracker = self.bot.get_cog("ActivityTrackerCog")
+        return tracker.vc_sessions.live_seconds(user_id) if tracker else 0
+
+    def _promotion_lines(self, member: discord.Member, stats: dict, live_vc_minutes: int) -> list[str]:
+        lines = []
+        for rule in self.promotions.candidate_rules(member):
+            if rule.window_days is None:
+                message_count, vc_minutes = stats["messages"], stats["vc_seconds"] // 60
+                scope = "all time"
+            else:
+                message_count, vc_minutes = stats["windows"].get(rule.window_days, (0, 0))
+                scope = f"last {rule.window_days} days"
+            vc_minutes += live_vc_minutes
+
+            target_role = member.guild.get_role(rule.target_role_id)
+            target = target_role.mention if target_role else rule.name
+            joiner = "and" if rule.logic == "AND" else "or"
+            lines.append(
+                f"**→ {target}** ({scope}, {joiner})\n"
+                f"`{progress_bar(message_count, rule.message_threshold)}` {message_count:,}/{rule.message_threshold:,} messages\n"
+                f"`{progress_bar(vc_minutes, rule.vc_threshold_minutes)}` {vc_minutes:,}/{rule.vc_threshold_minutes:,} VC minutes"
+            )
+        return lines
+
+    def _history_lines(self, guild: discord.Guild, history: list) -> list[str]:
+        lines = []
+        for role_id, action, source, ts in history:
+            role = guild.get_role(role_id)
+            role_text = role.mention if role else f"`{role_id}`"
+            when = f"<t:{ts}:R>" if ts else "some time ago"
+            lines.append(f"{when} {action} {role_text} — {source}")
+        return lines
+
+    @app_commands.command(name="stats", description="Shows a member's activity and promotion progress.")
+    @app_commands.describe(user="The member to look up.")
+    async def stats(self, interaction: discord.Interaction, user: discord.Member):
+        if not is_moderator(self.bot, interaction):
+            await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+            return
+
+        windows = {rule.window_days for rule in self.promotions.candidate_rules(user)}
+        stats = await db.fetch_user_stats(user.id, windows)
+        live_vc_minutes = self._live_vc_seconds(user.id) // 60
+
+        embed = discord.Embed(title=f"Stats for {user.display_name}", color=discord.Color.blue())
+        embed.set_thumbnail(url=user.display_avatar.url)
+        embed.add_field(name="Messages", value=f"{stats['messages']:,}")
+        embed.add_field(name="VC Time", value=format_minutes(stats["vc_seconds"] // 60 + live_vc_minutes))
+        embed.add_field(name="Last Active", value=f"<t:{stats['last_seen']}:R>" if stats["last_seen"] else "Never")
+
+        promotion_lines = self._promotion_lines(user, stats, live_vc_minutes)
+        embed.add_field(
+            name="Promotion Progress",
+            value="\n".join(promotion_lines)[:1024] if promotion_lines else "No further automatic promotions.",
+            inline=False
+        )
+
+        history_lines = self._history_lines(interaction.guild, stats["role_history"])
+        embed.add_field(
+            name="Recent Role History",
+            value="\n".join(history_lines)[:1024] if history_lines else "No role changes recorded.",
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(StatsCog(bot))
@@ -6,6 +6,8 @@ import yaml
 import os
 import asyncio
 from utils import database
+from utils.db import db
+from utils.join_pipeline import JoinPipeline
 import random
 import colorama
 from colorama import Fore, Style, init
@@ -32,6 +34,8 @@ class RoleManagerBot(commands.Bot):
         super().__init__(command_prefix="!", intents=intents)
         self.config = config
         self.guild_id = int(config["guild_id"])
+        # Shared by the cogs that assign roles on join, so a join wave is queued and paced as one
+        self.join_pipeline = JoinPipeline(self, config.get("join_wave", {}))
 
 
     def _generate_status(self, jackpot=False):
@@ -85,6 +89,14 @@ class RoleManagerBot(commands.Bot):
 
     async def setup_hook(self):
         """This is called when the AutoBot is preparing to start."""
+        # Start the batched writer before any cog can queue events
+        queue_config = self.config.get("event_queue", {})
+        database.writer.start(
+            batch_size=queue_config.get("batch_size"),
+            flush_interval=queue_config.get("flush_interval_seconds"),
+            max_queue=queue_config.get("max_queue")
+        )
+
         # Load all cogs from the 'cogs' directory
         for filename in os.listdir("./cogs"):
             if filename.endswith(".py"):
@@ -100,6 +112,14 @@ class RoleManagerBot(commands.Bot):
         await self.tree.sync(guild=guild)
         print(Style.BRIGHT + Fore.CYAN + "🔪 Slash commands synced to guild.")
 
+    async def close(self):
+        """Shuts the bot down, then drains any events still waiting in the write queue."""
+        await self.join_pipeline.close()
+        await super().close()
+        pending = database.writer.pending
+        await db.close()
+        print(Fore.CYAN + f"💾 Event queue drained ({pending} pending events written).")
+
     async def on_ready(self):
         """Called when AutoBot is connected and ready."""
         print("-" * 30)
@@ -142,6 +162,16 @@ class RoleManagerBot(commands.Bot):
 # --- Main Execution ---
 if __name__ == "__main__":
     # Initialize the database
+    db_config = config.get("database", {})
+    database.connections.configure(
+        busy_timeout_ms=db_config.get("busy_timeout_ms"),
+        cache_size_mb=db_config.get("cache_size_mb"),
+        max_retries=db_config.get("busy_retries")
+    )
+    db.configure_analytics(
+        workers=db_config.get("analytics_workers"),
+        timeout=db_config.get("analytics_timeout_seconds")
+    )
     database.init_db()
     
     # Create and run the bot instance
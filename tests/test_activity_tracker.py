@@ -0,0 +1,79 @@
+import asyncio
+import types
+import unittest
+import cogs.activity_tracker as activity_tracker
+from utils import database
+from utils.promotions import PromotionEngine
+from utils.voice_sessions import VoiceSessionTracker
+from tests.test_database import DatabaseTestCase
+
+MEMBER_ROLE, REGULAR_ROLE = 1, 2
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+        self.name = str(role_id)
+        self.mention = f"<@&{role_id}>"
+
+def make_member(user_id: int):
+    roles = {MEMBER_ROLE: FakeRole(MEMBER_ROLE), REGULAR_ROLE: FakeRole(REGULAR_ROLE)}
+    guild = types.SimpleNamespace(get_role=roles.get)
+    return types.SimpleNamespace(
+        id=user_id, bot=False, name=str(user_id), mention=f"<@{user_id}>", guild=guild, roles=[roles[MEMBER_ROLE]]
+    )
+
+def make_message(author, message_id: int):
+    return types.SimpleNamespace(
+        author=author, guild=object(), content="hello", id=message_id, channel=types.SimpleNamespace(id=10)
+    )
+
+class PromotionCheckTests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cog = object.__new__(activity_tracker.ActivityTrackerCog)
+        self.cog.promotions = PromotionEngine({"enabled": True, "promotions": [{
+            "name": "Member to Regular", "source_role_id": MEMBER_ROLE, "target_role_id": REGULAR_ROLE,
+            "message_threshold": 3, "vc_threshold_minutes": 600, "promotion_logic": "OR"
+        }]})
+        self.cog.vc_sessions = VoiceSessionTracker()
+        self.promoted = []
+
+        async def promote(member, rule, target_role, progress, lines=None):
+            self.promoted.append((member.id, rule.name, progress.counts()))
+            return True
+        self.cog._promote = promote
+
+    def test_first_observed_message_can_cross_the_threshold(self):
+        member = make_member(1)
+
+        async def chat():
+            # Two messages were counted before the bot started tracking the member
+            for message_id in (100, 101):
+                await database.log_message(member.id, 10, message_id)
+            # The third arrives while the writer batches (the flush interval is far away)
+            database.writer.start(flush_interval=60)
+            try:
+                await self.cog.on_message(make_message(member, 102))
+            finally:
+                await database.writer.close()
+
+        asyncio.run(chat())
+        self.assertEqual(self.promoted, [(1, "Member to Regular", (3, 0))])
+
+    def test_below_threshold_is_not_promoted(self):
+        member = make_member(1)
+
+        async def chat():
+            database.writer.start(flush_interval=60)
+            try:
+                for message_id in (100, 101):
+                    await self.cog.on_message(make_message(member, message_id))
+            finally:
+                await database.writer.close()
+
+        asyncio.run(chat())
+        self.assertEqual(self.promoted, [])
+        self.assertEqual(self.cog.promotions.progress[member.id].counts(), (2, 0))
+
+if __name__ == "__main__":
+    unittest.main()
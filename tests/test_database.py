@@ -0,0 +1,68 @@
+import asyncio
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from utils import database
+
+class DatabaseTestCase(unittest.TestCase):
+    """Points the database module at a fresh file for each test."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._saved = database.DB_FILE, database.ARCHIVE_DIR
+        database.DB_FILE = Path(self._tmp.name) / "server_activity.db"
+        database.ARCHIVE_DIR = database.DB_FILE.parent / "archive"
+        database.connections.db_file = database.analytics.db_file = database.DB_FILE
+        database.stats_cache.clear()
+        database.init_db()
+
+    def tearDown(self):
+        database.connections.close()
+        database.analytics.close()
+        database.DB_FILE, database.ARCHIVE_DIR = self._saved
+        database.connections.db_file = database.analytics.db_file = database.DB_FILE
+        self._tmp.cleanup()
+
+    def counters(self, user_id: int) -> tuple:
+        messages_total = database.connections.fetchone(
+            "SELECT messages_total FROM user_activity WHERE user_id = ?", (user_id,)
+        )
+        daily = database.connections.fetchone(
+            "SELECT messages FROM user_activity_daily WHERE user_id = ? AND day = ?", (user_id, int(time.time()) // 86400)
+        )
+        rows = database.connections.fetchone("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,))
+        return rows[0], messages_total[0], daily[0]
+
+class LogMessageTests(DatabaseTestCase):
+    def test_duplicate_message_id_is_counted_once(self):
+        async def log_twice():
+            await database.log_message(1, 10, message_id=500)
+            await database.log_message(1, 10, message_id=500)
+            await database.log_message(1, 10, message_id=501)
+
+        asyncio.run(log_twice())
+        self.assertEqual(self.counters(1), (2, 2, 2))
+
+    def test_duplicate_message_id_in_one_batch_is_counted_once(self):
+        async def log_batched():
+            database.writer.start(flush_interval=0.05)
+            for message_id in (500, 500, 501, 502, 501):
+                await database.log_message(1, 10, message_id=message_id)
+            await database.log_message(2, 10, message_id=503)
+            await database.writer.close()
+
+        asyncio.run(log_batched())
+        self.assertEqual(self.counters(1), (3, 3, 3))
+        self.assertEqual(self.counters(2), (1, 1, 1))
+
+    def test_messages_without_id_are_all_counted(self):
+        async def log_without_ids():
+            for _ in range(3):
+                await database.log_message(1, 10)
+
+        asyncio.run(log_without_ids())
+        self.assertEqual(self.counters(1), (3, 3, 3))
+
+if __name__ == "__main__":
+    unittest.main()
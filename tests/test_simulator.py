@@ -0,0 +1,57 @@
+import random
+import sqlite3
+import time
+import unittest
+from utils import simulator
+
+class SimulateTests(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        today = int(time.time()) // 86400
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.executescript("""
+            CREATE TABLE user_roles (user_id INTEGER, role_id INTEGER);
+            CREATE TABLE user_activity (user_id INTEGER, messages_total INTEGER, vc_seconds_total INTEGER);
+            CREATE TABLE user_activity_daily (user_id INTEGER, day INTEGER, messages INTEGER, vc_seconds INTEGER);
+        """)
+        self.conn.executemany("INSERT INTO user_roles VALUES (?, ?)", [
+            (user_id, role_id) for user_id in range(2000) for role_id in rng.sample([1, 2, 3, 4], rng.randint(1, 2))
+        ])
+        self.conn.executemany("INSERT INTO user_activity VALUES (?, ?, ?)", [
+            (user_id, rng.randint(0, 2000), rng.randint(0, 100000)) for user_id in range(0, 2000, 2)
+        ])
+        self.conn.executemany("INSERT INTO user_activity_daily VALUES (?, ?, ?, ?)", [
+            (user_id, today - rng.randint(0, 60), rng.randint(0, 50), rng.randint(0, 5000)) for user_id in range(0, 2000, 3)
+        ])
+        self.rules = simulator.load_rules([
+            {"name": "a", "source_role_id": 1, "target_role_id": 2, "message_threshold": 500, "vc_threshold_minutes": 600, "promotion_logic": "AND"},
+            {"name": "b", "source_role_id": 1, "target_role_id": 3, "message_threshold": 1500, "vc_threshold_minutes": 1000, "promotion_logic": "OR"},
+            {"name": "c", "source_role_id": 3, "target_role_id": 4, "message_threshold": 20, "vc_threshold_minutes": 50, "promotion_logic": "OR", "window_days": 30},
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def expected(self, columns: simulator.ActivityColumns) -> dict:
+        """The same rules checked user by user with PromotionRule.is_met."""
+        promoted = set()
+        results = {}
+        for rule in self.rules:
+            messages, vc_minutes = columns.windows[rule.window_days]
+            selected = [
+                index for index in range(len(columns))
+                if index in columns.holders(rule.source_role_id) and index not in columns.holders(rule.target_role_id)
+                and index not in promoted and rule.is_met(messages[index], vc_minutes[index])
+            ]
+            promoted.update(selected)
+            results[rule.name] = [columns.user_ids[index] for index in selected]
+        return results
+
+    def test_matches_rule_by_rule_evaluation(self):
+        columns = simulator.ActivityColumns(self.conn, {rule.window_days for rule in self.rules})
+        results = simulator.simulate(self.rules, columns)
+        self.assertEqual(results, self.expected(columns))
+        self.assertTrue(all(results.values()))
+
+if __name__ == "__main__":
+    unittest.main()
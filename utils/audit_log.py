@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import deque
+import discord
+
+class AuditLogCorrelator:
+    """
+    Matches member role updates to the audit log entries that caused them.
+
+    Entries arrive over the gateway (on_audit_log_entry_create) and are kept for `ttl` seconds, keyed
+    by target member and role diff. Gateway order isn't guaranteed, so a role update that arrives
+    before its entry waits up to `timeout` seconds to be woken by it, instead of polling the audit log.
+    """
+
+    def __init__(self, ttl: float = 30.0, timeout: float = 3.0):
+        self.ttl = ttl
+        self.timeout = timeout
+        # {target_id: [(expires, added role IDs, removed role IDs, entry)]}
+        self._entries = {}
+        # {target_id: [futures of role updates waiting for an entry]}
+        self._waiters = {}
+        # (expires, target_id) in arrival order, so pruning only looks at what has expired
+        self._expiry = deque()
+
+    def _prune(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, target_id = self._expiry.popleft()
+            entries = [item for item in self._entries.get(target_id, []) if item[0] > now]
+            if entries:
+                self._entries[target_id] = entries
+            else:
+                self._entries.pop(target_id, None)
+
+    def record(self, entry: discord.AuditLogEntry):
+        """Stores a member_role_update entry and wakes any role update waiting for that member."""
+        now = time.monotonic()
+        self._prune(now)
+        # For role updates, entry.after.roles were added and entry.before.roles removed
+        added = frozenset(role.id for role in getattr(entry.after, "roles", []) or [])
+        removed = frozenset(role.id for role in getattr(entry.before, "roles", []) or [])
+        self._entries.setdefault(entry.target.id, []).append((now + self.ttl, added, removed, entry))
+        self._expiry.append((now + self.ttl, entry.target.id))
+
+        for waiter in self._waiters.get(entry.target.id, []):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _take(self, target_id: int, added: frozenset, removed: frozenset):
+        """Removes and returns the best-matching live entry: the exact role diff first, else any overlapping one."""
+        now = time.monotonic()
+        entries = [item for item in self._entries.get(target_id, []) if item[0] > now]
+        match = next((item for item in entries if item[1] == added and item[2] == removed), None)
+        if match is None:
+            match = next((item for item in entries if item[1] & added or item[2] & removed), None)
+        if match is not None:
+            entries.remove(match)
+        if entries:
+            self._entries[target_id] = entries
+        else:
+            self._entries.pop(target_id, None)
+        return match[3] if match else None
+
+    async def resolve(self, target_id: int, added: set, removed: set):
+        """The audit log entry behind a role update, or None if none arrives within the timeout."""
+        added, removed = frozenset(added), frozenset(removed)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        while (entry := self._take(target_id, added, removed)) is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            waiter = loop.create_future()
+            self._waiters.setdefault(target_id, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                return self._take(target_id, added, removed)
+            finally:
+                self._waiters[target_id].remove(waiter)
+                if not self._waiters[target_id]:
+                    del self._waiters[target_id]
+        return entry
@@ -0,0 +1,166 @@
+"""
+Channel history backfill.
+
+Walks the history of every text and voice-text channel backwards from the oldest message already
+counted there, and imports the messages the bot never saw into the activity database. Each page of
+history is committed together with the channel's resume point, so an interrupted run simply carries
+on where it stopped.
+
+The oldest counted message is found through the daily rollups, so it stays correct after retention
+has archived or deleted the raw rows. Those rows are outside the message ID index, so a run never walks
+into the counted range, not even with --restart; within the live table messages are also deduplicated
+by message ID.
+
+CLI usage (logs in with DISCORD_TOKEN, reads guild_id from config.yaml):
+    python -m utils.backfill [--channel ID ...] [--restart] [--rate 4] [--workers 3]
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import discord
+import yaml
+from utils import database
+from utils.db import db
+from utils.rate_limit import RateLimiter
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+# Messages per history request (Discord's maximum)
+PAGE_SIZE = 100
+
+class BackfillProgress:
+    """Running totals of a backfill, safe to read while it runs."""
+
+    def __init__(self, channels_total: int):
+        self.channels_total = channels_total
+        self.channels_done = 0
+        self.messages_scanned = 0
+        self.messages_imported = 0
+        self.failed_channels = []
+        self.started = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Messages scanned per second so far."""
+        return self.messages_scanned / max(time.monotonic() - self.started, 0.001)
+
+    def summary(self) -> str:
+        return (
+            f"{self.channels_done}/{self.channels_total} channels, {self.messages_imported:,} new messages "
+            f"imported out of {self.messages_scanned:,} scanned ({self.rate:,.0f} msg/s)"
+        )
+
+def backfill_channels(guild: discord.Guild, channel_ids: set = None) -> list:
+    """The channels the bot can read history in, optionally limited to `channel_ids`."""
+    return [
+        channel for channel in guild.text_channels + guild.voice_channels
+        if channel.permissions_for(guild.me).read_message_history
+        and (not channel_ids or channel.id in channel_ids)
+    ]
+
+async def _resume_point(channel) -> tuple[int, bool]:
+    """(message ID to continue before, already finished) for a channel."""
+    # Everything since the oldest counted message was seen already. Channels without any start slightly
+    # in the past, so nothing still waiting in the write queue is picked up twice.
+    first_ts = await db.run_analytics(database.first_counted_ts, channel.id, timeout=60)
+    start = datetime.fromtimestamp(first_ts, timezone.utc) if first_ts else discord.utils.utcnow() - timedelta(minutes=1)
+    first_id = discord.utils.time_snowflake(start)
+
+    state = await db.run_read(database.get_backfill_state, channel.id)
+    if state:
+        before_id, done, _ = state
+        # A resume point saved inside the counted range (by an older version) is moved back out of it
+        return min(before_id, first_id), bool(done)
+    return first_id, False
+
+async def backfill_channel(channel, limiter: RateLimiter, progress: BackfillProgress):
+    before_id, done = await _resume_point(channel)
+
+    while not done:
+        async with limiter:
+            page = [message async for message in channel.history(limit=PAGE_SIZE, before=discord.Object(id=before_id))]
+
+        # Same filter as live logging in ActivityTrackerCog.on_message
+        rows = [
+            (message.id, message.author.id, int(message.created_at.timestamp()))
+            for message in page
+            if not message.author.bot and not message.content.startswith('/')
+        ]
+        if page:
+            before_id = min(message.id for message in page)
+        done = len(page) < PAGE_SIZE
+
+        progress.messages_scanned += len(page)
+        progress.messages_imported += await db.run_write(database.import_messages, channel.id, rows, before_id, done)
+
+    progress.channels_done += 1
+
+async def run_backfill(channels: list, progress: BackfillProgress, rate: float = 4, workers: int = 3):
+    """
+    Backfills the channels concurrently with `workers` workers, sharing one budget of `rate`
+    history requests per second. A channel that fails is reported and skipped.
+    """
+    limiter = RateLimiter(rate, burst=workers)
+    queue = asyncio.Queue()
+    for channel in channels:
+        queue.put_nowait(channel)
+
+    async def worker():
+        while not queue.empty():
+            channel = queue.get_nowait()
+            try:
+                await backfill_channel(channel, limiter, progress)
+            except Exception as e:
+                # Discord errors, analytics timeouts and database errors only cost this one channel
+                progress.failed_channels.append(channel)
+                print(Style.BRIGHT + Fore.RED + f"Backfill of #{channel.name} failed: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+
+async def report_progress(progress: BackfillProgress, interval: float = 10):
+    """Prints the totals every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        print(Fore.CYAN + f"Backfill: {progress.summary()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports channel history the bot never logged into the activity database.")
+    parser.add_argument("--channel", type=int, action="append", help="Only backfill this channel (repeatable)")
+    parser.add_argument("--restart", action="store_true", help="Forget saved progress and rescan from the oldest counted message")
+    parser.add_argument("--rate", type=float, default=4, help="History requests per second across all channels")
+    parser.add_argument("--workers", type=int, default=3, help="Channels fetched concurrently")
+    args = parser.parse_args()
+
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    database.init_db()
+
+    intents = discord.Intents.default()
+    intents.message_content = True  # Needed for the same '/' filter as live logging
+    client = discord.Client(intents=intents)
+
+    @client.event
+    async def on_ready():
+        try:
+            guild = client.get_guild(int(config["guild_id"]))
+            channels = backfill_channels(guild, set(args.channel or ()))
+            if args.restart:
+                for channel in channels:
+                    await db.run_write(database.reset_backfill_state, channel.id)
+
+            progress = BackfillProgress(len(channels))
+            reporter = asyncio.create_task(report_progress(progress))
+            await run_backfill(channels, progress, args.rate, args.workers)
+            reporter.cancel()
+            print(Style.BRIGHT + Fore.GREEN + f"Backfill finished: {progress.summary()}")
+        finally:
+            await db.close()
+            await client.close()
+
+    client.run(os.getenv("DISCORD_TOKEN"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Columnar archive files.
+
+Closed archive months are packed from their SQLite files into a compact column-oriented file
+(`YYYY-MM.col`). Each table is stored sorted by `ts` in row groups. Within a row group every
+column is its own compressed block (zlib or lzma), encoded one of two ways:
+
+- delta: integer columns stored as the first value and then the differences, in the narrowest array type
+  that fits, with a bitmap for any NULLs. Timestamps and snowflake IDs shrink to a few bits each.
+- dict: low-cardinality or mixed columns (channel IDs, event types, emoji, NULLs) stored as a small
+  dictionary plus an index array.
+
+The file ends with a zlib-compressed JSON footer listing every block and each row group's ts range. The
+reader memory-maps the file and only decompresses the columns and row groups a scan needs.
+
+CLI usage:
+    python -m utils.columnar info /data/archive/2024-03.col
+"""
+import argparse
+import bisect
+import json
+import lzma
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable, Iterator
+
+MAGIC = b"ACOL0001"
+_FOOTER = struct.Struct("<Q8s")
+# Rows per row group; bounds the memory a scan needs and lets range scans skip whole groups
+GROUP_ROWS = 65536
+COMPRESSIONS = ("lzma", "zlib", "none")
+
+_SIGNED_TYPES = (("b", 1 << 7), ("h", 1 << 15), ("i", 1 << 31), ("q", 1 << 63))
+_INDEX_TYPES = (("B", 1 << 8), ("H", 1 << 16), ("I", 1 << 32))
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "lzma":
+        return lzma.compress(data, preset=6)
+    if compression == "zlib":
+        return zlib.compress(data, 9)
+    return data
+
+def _decompress(data, compression: str) -> bytes:
+    if compression == "lzma":
+        return lzma.decompress(data)
+    if compression == "zlib":
+        return zlib.decompress(data)
+    return bytes(data)
+
+def _narrowest(types, low: int, high: int) -> str:
+    for typecode, limit in types:
+        if (low >= -limit if typecode.islower() else low >= 0) and high < limit:
+            return typecode
+    raise OverflowError(f"Values {low}..{high} don't fit a 64-bit column")
+
+def _to_bytes(values: array) -> bytes:
+    # Files are little-endian whatever machine wrote them
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode, data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+class ColumnarWriter:
+    """Writes tables into a new columnar file. Rows must be passed sorted by their `ts` column."""
+
+    def __init__(self, path: Path, compression: str = "lzma", group_rows: int = GROUP_ROWS):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+        self.path = Path(path)
+        self.compression = compression
+        self.group_rows = group_rows
+        self.tables = {}
+        self.properties = {}
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+
+    def _write_block(self, data: bytes) -> list:
+        offset = self._file.tell()
+        data = _compress(data, self.compression)
+        self._file.write(data)
+        return [offset, len(data)]
+
+    def _encode(self, values: list, sorted_column: bool = False) -> dict:
+        distinct = set(values)
+        integers = distinct - {None}
+        if integers and all(type(value) is int for value in integers) and (sorted_column or len(integers) > len(values) // 2):
+            encoded = {"encoding": "delta"}
+            if None in distinct:
+                # NULLs repeat the previous value (a zero delta) and are flagged in a bitmap
+                nulls = bytearray((len(values) + 7) // 8)
+                previous = next(value for value in values if value is not None)
+                filled = []
+                for index, value in enumerate(values):
+                    if value is None:
+                        nulls[index >> 3] |= 1 << (index & 7)
+                        value = previous
+                    filled.append(value)
+                    previous = value
+                encoded["nulls"] = self._write_block(bytes(nulls))
+                values = filled
+            deltas = [values[0]] + [b - a for a, b in zip(values, values[1:])]
+            encoded["type"] = _narrowest(_SIGNED_TYPES, min(deltas), max(deltas))
+            encoded["data"] = self._write_block(_to_bytes(array(encoded["type"], deltas)))
+            return encoded
+
+        dictionary = sorted(distinct, key=lambda value: (value is None, type(value).__name__, value if value is not None else 0))
+        positions = {value: index for index, value in enumerate(dictionary)}
+        typecode = _narrowest(_INDEX_TYPES, 0, len(dictionary))
+        return {
+            "encoding": "dict",
+            "type": typecode,
+            "dictionary": self._write_block(json.dumps(dictionary, ensure_ascii=False).encode("utf-8")),
+            "data": self._write_block(_to_bytes(array(typecode, (positions[value] for value in values)))),
+        }
+
+    def write_table(self, table: str, columns: list, rows: Iterable[tuple]) -> int:
+        """Writes a table from rows sorted by `ts`. Returns the number of rows written."""
+        ts_index = list(columns).index("ts")
+        groups = []
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.group_rows:
+                groups.append(self._write_group(columns, batch, ts_index))
+                total += len(batch)
+                batch = []
+        if batch:
+            groups.append(self._write_group(columns, batch, ts_index))
+            total += len(batch)
+
+        self.tables[table] = {"columns": list(columns), "rows": total, "groups": groups}
+        return total
+
+    def _write_group(self, columns: list, batch: list, ts_index: int) -> dict:
+        return {
+            "rows": len(batch),
+            "min_ts": batch[0][ts_index],
+            "max_ts": batch[-1][ts_index],
+            "columns": {column: self._encode([row[index] for row in batch], index == ts_index) for index, column in enumerate(columns)},
+        }
+
+    def close(self):
+        footer = {"version": 1, "compression": self.compression, "properties": self.properties, "tables": self.tables}
+        # The footer is always zlib, so it can be read before the file's compression is known
+        footer_offset = self._file.tell()
+        self._file.write(zlib.compress(json.dumps(footer).encode("utf-8"), 9))
+        self._file.write(_FOOTER.pack(footer_offset, MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self.path.unlink(missing_ok=True)
+
+class ColumnarArchive:
+    """A memory-mapped, read-only view of a columnar file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_offset, magic = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if self._map[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.path} is not a columnar archive")
+        footer = json.loads(zlib.decompress(self._map[footer_offset:len(self._map) - _FOOTER.size]))
+        self.compression = footer["compression"]
+        self.properties = footer.get("properties", {})
+        self.tables = footer["tables"]
+
+    def _read_block(self, block: list) -> bytes:
+        offset, length = block
+        return _decompress(self._map[offset:offset + length], self.compression)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def columns(self, table: str) -> list:
+        return self.tables[table]["columns"] if table in self.tables else []
+
+    def row_count(self, table: str) -> int:
+        return self.tables[table]["rows"] if table in self.tables else 0
+
+    def _decode(self, encoded: dict):
+        values = _from_bytes(encoded["type"], self._read_block(encoded["data"]))
+        if encoded["encoding"] == "delta":
+            values = array("q", accumulate(values))
+            if "nulls" not in encoded:
+                return values
+            nulls = self._read_block(encoded["nulls"])
+            return [None if nulls[index >> 3] >> (index & 7) & 1 else value for index, value in enumerate(values)]
+        dictionary = json.loads(self._read_block(encoded["dictionary"]))
+        return [dictionary[index] for index in values]
+
+    def _groups(self, table: str, since_ts: int = None, until_ts: int = None) -> Iterator[tuple[dict, int, int]]:
+        """Yields (row group, first row, end row) for the rows of each group inside [since_ts, until_ts)."""
+        for group in self.tables.get(table, {}).get("groups", []):
+            if (since_ts is not None and group["max_ts"] < since_ts) or (until_ts is not None and group["min_ts"] >= until_ts):
+                continue
+            start, end = 0, group["rows"]
+            if (since_ts is not None and group["min_ts"] < since_ts) or (until_ts is not None and group["max_ts"] >= until_ts):
+                # Rows are sorted by ts, so the range is a slice
+                ts = self._decode(group["columns"]["ts"])
+                start = bisect.bisect_left(ts, since_ts) if since_ts is not None else 0
+                end = bisect.bisect_left(ts, until_ts) if until_ts is not None else len(ts)
+            yield group, start, end
+
+    def scan(self, table: str, columns: list = None, since_ts: int = None, until_ts: int = None, user_id: int = None) -> Iterator[tuple]:
+        """
+        Yields rows of `columns` (default: all) with ts in [since_ts, until_ts), oldest first,
+        optionally only one user's. Columns the file doesn't have come back as None.
+        """
+        columns = columns or self.columns(table)
+        for group, start, end in self._groups(table, since_ts, until_ts):
+            stored = group["columns"]
+            values = [self._decode(stored[column])[start:end] if column in stored else [None] * (end - start) for column in columns]
+            if user_id is None:
+                yield from zip(*values)
+            else:
+                users = self._decode(stored["user_id"])[start:end]
+                yield from (row for row, row_user in zip(zip(*values), users) if row_user == user_id)
+
+def info(path: Path) -> str:
+    lines = [f"{path} ({path.stat().st_size / 1024:,.1f} KiB)"]
+    with ColumnarArchive(path) as archive:
+        lines.append(f"  compression: {archive.compression}")
+        for table in archive.tables:
+            groups = archive.tables[table]["groups"]
+            encodings = ", ".join(f"{column}={groups[0]['columns'][column]['encoding']}" for column in archive.columns(table)) if groups else ""
+            lines.append(f"  {table}: {archive.row_count(table):,} rows in {len(groups)} groups ({encodings})")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspects columnar archive files.")
+    parser.add_argument("command", choices=["info"])
+    parser.add_argument("paths", type=Path, nargs="+")
+    args = parser.parse_args()
+    for path in args.paths:
+        print(info(path))
+
+if __name__ == "__main__":
+    main()
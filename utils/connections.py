@@ -0,0 +1,250 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+# PRAGMAs applied to every connection. WAL itself is persistent and set once by init_db.
+# synchronous=NORMAL is durable across application crashes in WAL mode (only an OS crash
+# can lose the last commits), and saves an fsync per transaction.
+_PRAGMAS = """
+    PRAGMA busy_timeout = {busy_timeout_ms};
+    PRAGMA synchronous = NORMAL;
+    PRAGMA cache_size = -{cache_size_kib};
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = {mmap_size};
+"""
+
+def is_busy_error(error: sqlite3.Error) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED (including extended codes like BUSY_SNAPSHOT)."""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+@contextmanager
+def _attached(conn: sqlite3.Connection, attachments: dict):
+    """ATTACHes {alias: path} for the block. Has to happen outside any transaction."""
+    attachments = attachments or {}
+    attached = []
+    try:
+        for alias, path in attachments.items():
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+            attached.append(alias)
+        yield conn
+    finally:
+        for alias in attached:
+            conn.execute(f"DETACH DATABASE {alias}")
+
+class ConnectionManager:
+    """
+    Long-lived, tuned connections to one database file.
+
+    Every worker thread (asyncio.to_thread's pool) gets its own reader connection, kept for
+    the life of the thread, and all writes go through one dedicated writer connection guarded
+    by a lock. Connections keep a prepared statement cache, so the module-level SQL constants
+    are only compiled once per connection.
+
+    The database is shared with other processes (other bots, the backup job), so SQLITE_BUSY is
+    expected now and then: SQLite's own busy_timeout waits first, then whole operations are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, db_file: Path, busy_timeout_ms: int = 5000, cache_size_kib: int = 16384,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256,
+                 max_retries: int = 5, retry_delay: float = 0.05):
+        self.db_file = db_file
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.busy_retries = 0
+
+        self._local = threading.local()
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._all_connections = []
+        self._registry_lock = threading.Lock()
+        # Bumped by close(), so threads notice their cached reader is gone
+        self._generation = 0
+
+    def configure(self, busy_timeout_ms: int = None, cache_size_mb: int = None, max_retries: int = None):
+        """Applies settings from config.yaml. Only affects connections opened afterwards."""
+        self.busy_timeout_ms = busy_timeout_ms or self.busy_timeout_ms
+        self.cache_size_kib = cache_size_mb * 1024 if cache_size_mb else self.cache_size_kib
+        self.max_retries = max_retries if max_retries is not None else self.max_retries
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.executescript(_PRAGMAS.format(
+            busy_timeout_ms=self.busy_timeout_ms, cache_size_kib=self.cache_size_kib, mmap_size=self.mmap_size
+        ))
+        with self._registry_lock:
+            self._all_connections.append(conn)
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """The calling thread's reader connection, opened on first use."""
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.conn = self._connect()
+            local.generation = self._generation
+        return local.conn
+
+    def _retry(self, operation, *args):
+        """Runs operation(*args), retrying with exponential backoff while the database is busy."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return operation(*args)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == self.max_retries:
+                    raise
+                self.busy_retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def fetchone(self, sql: str, params=()):
+        return self._retry(lambda: self.reader().execute(sql, params).fetchone())
+
+    def fetchall(self, sql: str, params=()) -> list:
+        return self._retry(lambda: self.reader().execute(sql, params).fetchall())
+
+    def read(self, fn, *args):
+        """Calls fn(conn, *args) with this thread's reader, for reads that take several queries."""
+        return self._retry(lambda: fn(self.reader(), *args))
+
+    def write(self, fn, *args):
+        """
+        Calls fn(conn, *args) inside one write transaction on the writer connection and commits.
+        The transaction starts with BEGIN IMMEDIATE, so a busy database is hit (and retried)
+        up front rather than half-way through. On any error the transaction is rolled back.
+        """
+        return self._retry(self._write_once, fn, args, None)
+
+    def write_attached(self, attachments: dict, fn, *args):
+        """Like write, with other database files ({alias: path}) attached around the transaction."""
+        return self._retry(self._write_once, fn, args, attachments)
+
+    def _write_once(self, fn, args, attachments):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+
+            with _attached(conn, attachments):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = fn(conn, *args)
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+                return result
+
+    def close(self):
+        """Closes every connection. Threads transparently reconnect if they're used again."""
+        with self._write_lock, self._registry_lock:
+            for conn in self._all_connections:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    print(Style.BRIGHT + Fore.RED + f"❌ Failed to close a database connection: {e}")
+            self._all_connections.clear()
+            self._writer = None
+            self._generation += 1
+
+class QueryTimeout(Exception):
+    """An analytics query ran past its time limit and was interrupted."""
+
+class ReadOnlyPool:
+    """
+    A small pool of read-only connections (mode=ro) for heavy analytic queries (stats, leaderboards).
+
+    Under WAL these read from a snapshot and never take the write lock, so however slow they are,
+    event ingest keeps going. Queries get a deadline enforced by a progress handler, which aborts
+    them from inside SQLite instead of letting them run on.
+    """
+
+    def __init__(self, db_file: Path, size: int = 2, timeout: float = 10.0, cache_size_kib: int = 8192,
+                 cached_statements: int = 64):
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+
+        self.timeouts = 0
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._generation = 0
+
+    def configure(self, size: int = None, timeout: float = None):
+        self.size = size or self.size
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.timeout = timeout or self.timeout
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.db_file}?mode=ro",
+            uri=True,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.executescript(f"""
+            PRAGMA query_only = ON;
+            PRAGMA cache_size = -{self.cache_size_kib};
+            PRAGMA temp_store = MEMORY;
+        """)
+        return conn
+
+    def run(self, fn, *args, timeout: float = None):
+        """
+        Calls fn(conn, *args) on a read-only connection, raising QueryTimeout if it takes longer than
+        `timeout` seconds (the pool default if not given). At most `size` queries run at once.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        with self._slots:
+            try:
+                generation, conn = self._idle.get_nowait()
+                if generation != self._generation:
+                    conn.close()
+                    raise queue.Empty
+            except queue.Empty:
+                generation, conn = self._generation, self._connect()
+
+            # Checked every few thousand VM instructions; a non-zero return interrupts the query
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            try:
+                return fn(conn, *args)
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > deadline and "interrupt" in str(e):
+                    self.timeouts += 1
+                    raise QueryTimeout(f"Query exceeded {timeout or self.timeout:.0f} s") from e
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+                self._idle.put((generation, conn))
+
+    def close(self):
+        """Closes the idle connections; any in use are closed when they come back."""
+        self._generation += 1
+        while True:
+            try:
+                _, conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
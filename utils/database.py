@@ -1,128 +1,647 @@
 ﻿import sqlite3
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
-from datetime import datetime
+from typing import Iterable, Iterator, List
 from utils import schema
+from utils.cache import TTLCache
+from utils.columnar import ColumnarArchive
+from utils.connections import ConnectionManager, ReadOnlyPool
+from utils.event_writer import EventWriter
 
 # Path to the database file in the project's root directory
 DB_FILE = Path("/data/server_activity.db")
 
+# Old raw events are moved into one file per month (e.g. archive/2026-09.db) by utils.rollups
+ARCHIVE_DIR = DB_FILE.parent / "archive"
+
+# Long-lived connections (one reader per worker thread, one writer) shared by every helper below
+connections = ConnectionManager(DB_FILE)
+
+# Read-only snapshot connections for heavy stats queries, kept apart from the ingest path
+analytics = ReadOnlyPool(DB_FILE)
+
+# Single long-lived writer for high-volume activity events (started by the bot in setup_hook)
+writer = EventWriter(connections)
+
+# Per-user stats profiles for /stats. The functions below that change a user's counters or roles
+# invalidate the entry; since event writes are queued, the TTL bounds how long a profile read in
+# between can stay behind.
+stats_cache = TTLCache(maxsize=2048, ttl=30)
+
 def init_db():
     """Initializes the database using the centralized schema."""
+    # WAL is a persistent property of the file; the connection manager relies on it
     with sqlite3.connect(DB_FILE) as conn:
+        # Takes effect only on a brand new file (before WAL writes its header); existing ones need schema.vacuum
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
         conn.execute("PRAGMA journal_mode=WAL;")
 
-    schema.initialize_database()
+    applied = schema.initialize_database(DB_FILE)
 
-def log_message(user_id: int, channel_id: int):
-    """Logs a single message event to the database."""
-    with sqlite3.connect(DB_FILE) as conn:
-        timestamp = datetime.utcnow().isoformat()
-        conn.execute(
-            "INSERT INTO messages (user_id, channel_id, timestamp) VALUES (?, ?, ?)",
-            (user_id, channel_id, timestamp)
-        )
+    # Seed the counters from the raw history the first time the table appears
+    if schema.USER_ACTIVITY_VERSION in applied:
+        rebuild_user_activity()
 
-def log_vc_event(user_id: int, channel_id: int, event_type: str):
-    """Logs a voice channel join or leave event."""
-    with sqlite3.connect(DB_FILE) as conn:
-        timestamp = datetime.utcnow().isoformat()
-        conn.execute(
-            "INSERT INTO vc_events (user_id, channel_id, event_type, timestamp) VALUES (?, ?, ?, ?)",
-            (user_id, channel_id, event_type, timestamp)
-        )
+# --- Materialized per-user counters ---
+# Kept up to date by the log_* functions in the same transaction as the raw event,
+# so promotion checks read one row instead of scanning a user's history.
+
+# Live messages only count if their row was actually inserted: the backfill overlap and gateway replays
+# deliver message IDs that are already stored. changes() is the row count of the previous statement in
+# the group (the INSERT OR IGNORE, then the guarded counter bump), so both bumps follow the insert.
+_BUMP_NEW_MESSAGE = """
+    INSERT INTO user_activity (user_id, messages_total, last_seen) SELECT ?, 1, ? WHERE changes() = 1
+    ON CONFLICT(user_id) DO UPDATE SET
+        messages_total = messages_total + 1,
+        last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)"""
+
+# Daily buckets (day = UTC days since the epoch) back the windowed promotion rules
+_BUMP_DAILY_NEW_MESSAGE = """
+    INSERT INTO user_activity_daily (user_id, day, messages) SELECT ?, ?, 1 WHERE changes() = 1
+    ON CONFLICT(user_id, day) DO UPDATE SET messages = messages + 1"""
+
+_TOUCH_LAST_SEEN = """
+    INSERT INTO user_activity (user_id, last_seen) VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)"""
+
+async def log_message(user_id: int, channel_id: int, message_id: int = None):
+    """Queues a single message event for the batched writer."""
+    ts = int(time.time())
+    await writer.submit_group([
+        # OR IGNORE: a message the history backfill imported first must not fail the whole batch
+        ("INSERT OR IGNORE INTO messages (user_id, channel_id, ts, message_id) VALUES (?, ?, ?, ?)",
+         (user_id, channel_id, ts, message_id)),
+        (_BUMP_NEW_MESSAGE, (user_id, ts)),
+        (_BUMP_DAILY_NEW_MESSAGE, (user_id, ts // 86400))
+    ])
+    stats_cache.invalidate(user_id)
+
+async def log_vc_event(user_id: int, channel_id: int, event_type: str):
+    """Queues a voice channel join, leave or move event. VC time itself is credited through vc_sessions."""
+    ts = int(time.time())
+    await writer.submit_group([
+        ("INSERT INTO vc_events (user_id, channel_id, event_type, ts) VALUES (?, ?, ?, ?)",
+         (user_id, channel_id, event_type, ts)),
+        (_TOUCH_LAST_SEEN, (user_id, ts))
+    ])
+    stats_cache.invalidate(user_id)
+
+# --- Voice sessions ---
+# A session is keyed by (user_id, started_at). Every checkpoint credits the time since the
+# previous checkpoint to user_activity, so VC time counts while the user is still connected.
+
+_OPEN_VC_SESSION = """
+    INSERT INTO vc_sessions (user_id, channel_id, started_at, last_checkpoint) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, started_at) DO UPDATE SET channel_id = excluded.channel_id, ended_at = NULL"""
+
+_CREDIT_VC_SESSION = """
+    INSERT INTO user_activity (user_id, vc_seconds_total, last_seen)
+    SELECT user_id, :ts - last_checkpoint, :ts FROM vc_sessions
+    WHERE user_id = :user_id AND started_at = :started_at AND last_checkpoint < :ts
+    ON CONFLICT(user_id) DO UPDATE SET
+        vc_seconds_total = vc_seconds_total + excluded.vc_seconds_total,
+        last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)"""
+
+_CREDIT_VC_SESSION_DAILY = """
+    INSERT INTO user_activity_daily (user_id, day, vc_seconds)
+    SELECT user_id, :ts / 86400, :ts - last_checkpoint FROM vc_sessions
+    WHERE user_id = :user_id AND started_at = :started_at AND last_checkpoint < :ts
+    ON CONFLICT(user_id, day) DO UPDATE SET vc_seconds = vc_seconds + excluded.vc_seconds"""
+
+_CHECKPOINT_VC_SESSION = """
+    UPDATE vc_sessions SET last_checkpoint = :ts
+    WHERE user_id = :user_id AND started_at = :started_at AND last_checkpoint < :ts"""
+
+_END_VC_SESSION = """
+    UPDATE vc_sessions SET ended_at = :ts WHERE user_id = :user_id AND started_at = :started_at"""
+
+async def open_vc_session(user_id: int, channel_id: int, started_at: int):
+    """Queues the start of a voice session."""
+    await writer.submit(_OPEN_VC_SESSION, (user_id, channel_id, started_at, started_at))
+
+async def checkpoint_vc_sessions(sessions: list[tuple[int, int]], ts: int):
+    """Credits every open (user_id, started_at) session up to `ts`, all in one transaction."""
+    if not sessions:
+        return
+    params = [{"user_id": user_id, "started_at": started_at, "ts": ts} for user_id, started_at in sessions]
+    # Credits first: they read last_checkpoint before it is moved forward
+    await writer.submit_group(
+        [(_CREDIT_VC_SESSION, p) for p in params]
+        + [(_CREDIT_VC_SESSION_DAILY, p) for p in params]
+        + [(_CHECKPOINT_VC_SESSION, p) for p in params]
+    )
+    for user_id, _ in sessions:
+        stats_cache.invalidate(user_id)
+
+async def close_vc_session(user_id: int, started_at: int, ts: int):
+    """Credits the rest of a session and marks it as ended."""
+    params = {"user_id": user_id, "started_at": started_at, "ts": ts}
+    await writer.submit_group([
+        (_CREDIT_VC_SESSION, params),
+        (_CREDIT_VC_SESSION_DAILY, params),
+        (_CHECKPOINT_VC_SESSION, params),
+        (_END_VC_SESSION, params)
+    ])
+    stats_cache.invalidate(user_id)
+
+async def close_stale_vc_sessions():
+    """
+    Ends sessions left open by a previous run at their last checkpoint.
+    Whatever happened after that checkpoint is unknown, so it isn't credited.
+    """
+    await writer.submit(
+        "UPDATE vc_sessions SET ended_at = last_checkpoint WHERE ended_at IS NULL", ()
+    )
 
 def get_user_activity(user_id: int) -> tuple[int, int]:
+    """Returns a user's (message count, VC minutes) from the materialized counters."""
+    row = connections.fetchone(
+        "SELECT messages_total, vc_seconds_total FROM user_activity WHERE user_id = ?",
+        (user_id,)
+    )
+
+    if not row:
+        return 0, 0
+    message_count, vc_seconds = row
+    return message_count, vc_seconds // 60
+
+def _read_user_stats(conn: sqlite3.Connection, user_id: int, windows: frozenset, history_limit: int) -> dict:
+    row = conn.execute(
+        "SELECT messages_total, vc_seconds_total, last_seen FROM user_activity WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    message_count, vc_seconds, last_seen = row or (0, 0, None)
+
+    today = int(time.time()) // 86400
+    window_counts = {}
+    for window_days in windows:
+        window_messages, window_vc_seconds = conn.execute(
+            """SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(vc_seconds), 0)
+               FROM user_activity_daily WHERE user_id = ? AND day > ?""",
+            (user_id, today - window_days)
+        ).fetchone()
+        window_counts[window_days] = (window_messages, window_vc_seconds // 60)
+
+    history = conn.execute(
+        "SELECT role_id, action, source, ts FROM role_history WHERE user_id = ? ORDER BY ts DESC LIMIT ?",
+        (user_id, history_limit)
+    ).fetchall()
+
+    return {
+        "messages": message_count,
+        "vc_seconds": vc_seconds,
+        "last_seen": last_seen,
+        "windows": window_counts,
+        "role_history": history,
+    }
+
+def get_user_stats(user_id: int, windows: set = frozenset(), history_limit: int = 5) -> dict:
     """
-    Calculates a user's activity stats on-the-fly from the event tables.
+    Returns a user's stats profile: lifetime counters, last_seen, {window_days: (messages, VC minutes)}
+    for the requested windows and their latest role history entries. Served from the materialized
+    counters (never the raw event tables) and cached until one of the user's events invalidates it.
     """
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        
-        # 1. Get total message count by counting rows
-        cursor.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,))
-        message_count = cursor.fetchone()[0]
-        
-        # 2. Calculate total VC time by pairing join/leave events
-        cursor.execute(
-            "SELECT event_type, timestamp FROM vc_events WHERE user_id = ? ORDER BY timestamp ASC",
-            (user_id,)
+    windows = frozenset(window for window in windows if window is not None)
+    stats = stats_cache.get(user_id)
+    if stats is None or not windows <= stats["windows"].keys() or stats["history_limit"] < history_limit:
+        stats = connections.read(_read_user_stats, user_id, windows, history_limit)
+        stats["history_limit"] = history_limit
+        stats_cache.put(user_id, stats)
+    return stats
+
+def get_all_user_activity() -> dict[int, tuple[int, int]]:
+    """Returns {user_id: (message count, VC minutes)} for every user, in a single query."""
+    rows = connections.fetchall("SELECT user_id, messages_total, vc_seconds_total / 60 FROM user_activity")
+    return {user_id: (message_count, vc_minutes) for user_id, message_count, vc_minutes in rows}
+
+def get_all_last_seen() -> dict[int, int]:
+    """Returns {user_id: last_seen} for every user seen at least once, in a single query."""
+    rows = connections.fetchall("SELECT user_id, last_seen FROM user_activity WHERE last_seen IS NOT NULL")
+    return dict(rows)
+
+def get_user_activity_windows(user_id: int, windows: set) -> dict:
+    """
+    Returns {window_days: (message count, VC minutes)} for the requested windows.
+    None means lifetime totals; a number of days sums that many daily buckets (today included).
+    """
+    results = {}
+    for window_days in windows:
+        if window_days is None:
+            row = connections.fetchone(
+                "SELECT messages_total, vc_seconds_total FROM user_activity WHERE user_id = ?", (user_id,)
+            )
+        else:
+            row = connections.fetchone(
+                """SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(vc_seconds), 0)
+                   FROM user_activity_daily WHERE user_id = ? AND day > ?""",
+                (user_id, int(time.time()) // 86400 - window_days)
+            )
+        message_count, vc_seconds = row or (0, 0)
+        results[window_days] = (message_count, vc_seconds // 60)
+    return results
+
+def get_all_window_activity(window_days: int) -> dict[int, tuple[int, int]]:
+    """Returns {user_id: (message count, VC minutes)} over the last `window_days` days for every user."""
+    rows = connections.fetchall(
+        """SELECT user_id, SUM(messages), SUM(vc_seconds) / 60 FROM user_activity_daily
+           WHERE day > ? GROUP BY user_id""",
+        (int(time.time()) // 86400 - window_days,)
+    )
+    return {user_id: (message_count, vc_minutes) for user_id, message_count, vc_minutes in rows}
+
+def compact_daily_activity(keep_days: int) -> int:
+    """Deletes daily buckets older than `keep_days` days. Lifetime totals live in user_activity and are unaffected."""
+    return connections.write(
+        lambda conn: conn.execute(
+            "DELETE FROM user_activity_daily WHERE day <= ?", (int(time.time()) // 86400 - keep_days,)
+        ).rowcount
+    )
+
+def rebuild_user_activity() -> int:
+    """
+    Recomputes every user's counters from the raw event tables.
+    Runs in a single write transaction, so queued events simply land on top of the rebuilt values.
+    Returns the number of users with counters.
+    """
+    user_count = connections.write(_rebuild_user_activity)
+    stats_cache.clear()
+    return user_count
+
+def _rebuild_user_activity(conn: sqlite3.Connection) -> int:
+    conn.execute("DELETE FROM user_activity")
+
+    # Old raw messages get pruned once rolled up, so count the daily rollups plus whatever is past the watermark
+    conn.execute("""
+        INSERT INTO user_activity (user_id, messages_total, last_seen)
+        SELECT user_id, SUM(events), MAX(last_ts) FROM (
+            SELECT user_id, events, last_ts FROM channel_activity_daily WHERE source = 'messages'
+            UNION ALL
+            SELECT user_id, 1, ts FROM messages
+            WHERE rowid > (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE source = 'messages')
+        )
+        GROUP BY user_id""")
+
+    # Credited VC time is simply everything up to each session's last checkpoint
+    conn.execute("""
+        INSERT INTO user_activity (user_id, vc_seconds_total, last_seen)
+        SELECT user_id, SUM(last_checkpoint - started_at), MAX(last_checkpoint)
+        FROM vc_sessions
+        WHERE true
+        GROUP BY user_id
+        ON CONFLICT(user_id) DO UPDATE SET
+            vc_seconds_total = excluded.vc_seconds_total,
+            last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)""")
+
+    return conn.execute("SELECT COUNT(*) FROM user_activity").fetchone()[0]
+
+# --- History backfill ---
+
+def get_backfill_state(channel_id: int):
+    """Returns (before_id, done, imported) for a channel, or None if it was never backfilled."""
+    return connections.fetchone(
+        "SELECT before_id, done, imported FROM backfill_state WHERE channel_id = ?", (channel_id,)
+    )
+
+def first_counted_ts(conn: sqlite3.Connection, channel_id: int):
+    """
+    The timestamp of the oldest message counted in a channel (live-logged or imported), or None.
+    Everything after it is already counted, even once retention has archived or deleted the raw rows.
+    Runs on an analytics connection.
+    """
+    # Rows waiting for the next rollup, e.g. from a backfill still in progress
+    first_ts = conn.execute("SELECT MIN(ts) FROM messages WHERE channel_id = ?", (channel_id,)).fetchone()[0]
+    # Daily rollups are kept for good, so they reach back past raw_event_days
+    first_day = conn.execute(
+        "SELECT MIN(day) FROM channel_activity_daily WHERE source = 'messages' AND channel_id = ?", (channel_id,)
+    ).fetchone()[0]
+    if first_day is None or (first_ts is not None and first_ts < first_day * 86400):
+        return first_ts
+
+    # The exact time from that day's raw rows, wherever they're stored; the start of the day if they're gone
+    day_start = first_day * 86400
+    in_day = min(
+        (ts for row_channel, ts in query_events(conn, "messages", ["channel_id", "ts"], day_start, day_start + 86400) if row_channel == channel_id),
+        default=day_start
+    )
+    return in_day if first_ts is None else min(in_day, first_ts)
+
+def reset_backfill_state(channel_id: int = None):
+    """Forgets backfill progress for one channel, or for all of them."""
+    if channel_id is None:
+        connections.write(lambda conn: conn.execute("DELETE FROM backfill_state"))
+    else:
+        connections.write(lambda conn: conn.execute("DELETE FROM backfill_state WHERE channel_id = ?", (channel_id,)))
+
+def _import_messages(conn: sqlite3.Connection, channel_id: int, messages: list, before_id: int, done: bool) -> int:
+    inserted = 0
+    bumps = {}
+    for message_id, user_id, ts in messages:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO messages (user_id, channel_id, ts, message_id) VALUES (?, ?, ?, ?)",
+            (user_id, channel_id, ts, message_id)
         )
-        events = cursor.fetchall()
-        
-        total_seconds = 0
-        join_time = None
-        
-        for event_type, timestamp_str in events:
-            # Parse the ISO format timestamp string into a datetime object
-            event_time = datetime.fromisoformat(timestamp_str)
-            
-            if event_type == 'join':
-                # If we see a join, record the time
-                join_time = event_time
-            elif event_type == 'leave' and join_time:
-                # If we see a leave and have a previous join time, calculate the duration
-                duration = event_time - join_time
-                total_seconds += duration.total_seconds()
-                join_time = None # Reset for the next session
-        
-        vc_time_minutes = int(total_seconds // 60)
-        
-        return message_count, vc_time_minutes
+        if cursor.rowcount:
+            inserted += 1
+            count, last_ts = bumps.get((user_id, ts // 86400), (0, 0))
+            bumps[(user_id, ts // 86400)] = (count + 1, max(last_ts, ts))
+
+    # Counters only for rows that were actually new
+    conn.executemany(
+        """INSERT INTO user_activity (user_id, messages_total, last_seen) VALUES (?, ?, ?)
+           ON CONFLICT(user_id) DO UPDATE SET
+               messages_total = messages_total + excluded.messages_total,
+               last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen)""",
+        [(user_id, count, last_ts) for (user_id, _), (count, last_ts) in bumps.items()]
+    )
+    conn.executemany(
+        """INSERT INTO user_activity_daily (user_id, day, messages) VALUES (?, ?, ?)
+           ON CONFLICT(user_id, day) DO UPDATE SET messages = messages + excluded.messages""",
+        [(user_id, day, count) for (user_id, day), (count, _) in bumps.items()]
+    )
+
+    # The checkpoint commits together with the rows, so a resumed run never skips or repeats a page
+    conn.execute(
+        """INSERT INTO backfill_state (channel_id, before_id, done, imported, updated_at) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(channel_id) DO UPDATE SET
+               before_id = excluded.before_id,
+               done = excluded.done,
+               imported = imported + excluded.imported,
+               updated_at = excluded.updated_at""",
+        (channel_id, before_id, int(done), inserted, int(time.time()))
+    )
+    return inserted
+
+def import_messages(channel_id: int, messages: list, before_id: int, done: bool = False) -> int:
+    """
+    Imports one page of channel history ([(message_id, user_id, ts)]) in a single transaction,
+    skipping messages already stored, and records `before_id` as the channel's resume point.
+    Returns the number of new messages.
+    """
+    inserted = connections.write(_import_messages, channel_id, messages, before_id, done)
+    for user_id in {user_id for _, user_id, _ in messages}:
+        stats_cache.invalidate(user_id)
+    return inserted
+
+# --- Leaderboard ---
+# Rankings are recomputed into the leaderboard table on a schedule; pages are then a single
+# index range scan, whatever the size of the event history.
+
+# Period name -> days of daily buckets it covers (None = lifetime)
+LEADERBOARD_PERIODS = {"all": None, "month": 30, "week": 7, "day": 1}
+
+_REACTION_SCORES = """
+    SELECT user_id, SUM(events) AS score FROM (
+        SELECT user_id, events FROM channel_activity_daily
+        WHERE source = 'reactions' AND event_type = 'add' AND day > :first_day
+        UNION ALL
+        SELECT user_id, 1 FROM reactions
+        WHERE event_type = 'add' AND ts >= (:first_day + 1) * 86400
+          AND rowid > (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE source = 'reactions')
+    )
+    GROUP BY user_id"""
+
+_LEADERBOARD_SCORES = {
+    ("messages", False): "SELECT user_id, messages_total AS score FROM user_activity",
+    ("messages", True): "SELECT user_id, SUM(messages) AS score FROM user_activity_daily WHERE day > :first_day GROUP BY user_id",
+    ("voice", False): "SELECT user_id, vc_seconds_total AS score FROM user_activity",
+    ("voice", True): "SELECT user_id, SUM(vc_seconds) AS score FROM user_activity_daily WHERE day > :first_day GROUP BY user_id",
+    ("reactions", False): _REACTION_SCORES,
+    ("reactions", True): _REACTION_SCORES,
+}
+
+def _rebuild_leaderboard(conn: sqlite3.Connection, metric: str, period: str) -> int:
+    days = LEADERBOARD_PERIODS[period]
+    first_day = int(time.time()) // 86400 - days if days else -1
+    conn.execute("DELETE FROM leaderboard WHERE metric = ? AND period = ?", (metric, period))
+    return conn.execute(
+        f"""INSERT INTO leaderboard (metric, period, user_id, score)
+            SELECT :metric, :period, user_id, score FROM ({_LEADERBOARD_SCORES[(metric, days is not None)]})
+            WHERE score > 0""",
+        {"metric": metric, "period": period, "first_day": first_day}
+    ).rowcount
+
+def rebuild_leaderboard(metric: str, period: str) -> int:
+    """Recomputes one ranking in a single short transaction. Returns the number of ranked users."""
+    return connections.write(_rebuild_leaderboard, metric, period)
+
+def leaderboard_page(conn: sqlite3.Connection, metric: str, period: str, after: tuple = None, limit: int = 10) -> list[tuple[int, int]]:
+    """
+    Returns up to `limit` (user_id, score) rows in rank order, starting after the (score, user_id)
+    keyset cursor of the previous page. Runs on an analytics connection.
+    """
+    if after is None:
+        return conn.execute(
+            "SELECT user_id, score FROM leaderboard WHERE metric = ? AND period = ? ORDER BY score DESC, user_id LIMIT ?",
+            (metric, period, limit)
+        ).fetchall()
+
+    score, user_id = after
+    return conn.execute(
+        """SELECT user_id, score FROM leaderboard
+           WHERE metric = ? AND period = ? AND score <= ? AND (score < ? OR user_id > ?)
+           ORDER BY score DESC, user_id LIMIT ?""",
+        (metric, period, score, score, user_id, limit)
+    ).fetchall()
+
+# --- Archived history ---
+
+def archive_path(month: str) -> Path:
+    """The archive file for a 'YYYY-MM' month."""
+    return ARCHIVE_DIR / f"{month}.db"
+
+def columnar_path(month: str) -> Path:
+    """The packed columnar file for a closed 'YYYY-MM' month (see utils.columnar)."""
+    return ARCHIVE_DIR / f"{month}.col"
+
+def archive_signature(path: Path) -> str:
+    """Identifies one version of a SQLite archive file; a columnar file stores the one it was packed from."""
+    stat = path.stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def month_bounds(month: str) -> tuple[int, int]:
+    """The [start, end) epoch range of a 'YYYY-MM' month (UTC)."""
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+def archived_months(since_ts: int = None, until_ts: int = None) -> list[str]:
+    """The archive months on disk that overlap [since_ts, until_ts), oldest first."""
+    months = []
+    # A month can have both files: rows archived after it was packed wait in the SQLite file
+    for month in sorted({path.stem for path in ARCHIVE_DIR.glob("????-??.db")} | {path.stem for path in ARCHIVE_DIR.glob("????-??.col")}):
+        start, end = month_bounds(month)
+        if (since_ts is None or end > since_ts) and (until_ts is None or start < until_ts):
+            months.append(month)
+    return months
+
+def _select_range(conn: sqlite3.Connection, schema: str, table: str, columns: list, time_column: str,
+                  since_ts: int, until_ts: int, user_id: int) -> Iterator[tuple]:
+    present = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+    if not present:
+        return
+    # Older archive files may predate a column; it comes back as None rather than failing
+    select = ", ".join(column if column in present else f"NULL AS {column}" for column in columns)
+    conditions, params = [], ()
+    if since_ts is not None:
+        conditions.append(f"{time_column} >= ?")
+        params += (since_ts,)
+    if until_ts is not None:
+        conditions.append(f"{time_column} < ?")
+        params += (until_ts,)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params += (user_id,)
+    where = " AND ".join(conditions) or "1"
+    yield from conn.execute(f"SELECT {select} FROM {schema}.{table} WHERE {where} ORDER BY {time_column}", params)
+
+def query_events(conn: sqlite3.Connection, table: str, columns: list, since_ts: int = None, until_ts: int = None,
+                 user_id: int = None, time_column: str = "ts") -> Iterator[tuple]:
+    """
+    Streams `columns` of a raw event table with `time_column` in [since_ts, until_ts), optionally only one
+    user's, across the archive months overlapping the range and then the live database, as if it had never
+    been split. Rows come oldest month first, ordered by time within each file.
+
+    Archive files are only opened while they're being read: packed months are memory-mapped, SQLite months
+    are ATTACHed read-only to `conn`, so it must not be inside a transaction.
+    """
+    for month in archived_months(since_ts, until_ts):
+        yield from _query_month(conn, month, table, columns, time_column, since_ts, until_ts, user_id)
+    yield from _select_range(conn, "main", table, columns, time_column, since_ts, until_ts, user_id)
+
+def _query_month(conn: sqlite3.Connection, month: str, table: str, columns: list, time_column: str,
+                 since_ts: int, until_ts: int, user_id: int) -> Iterator[tuple]:
+    # The SQLite file is attached before the columnar file is opened. A pack finishing in between
+    # (see utils.rollups) only deletes the SQLite file once the columnar one holds its rows, so
+    # either the attached file is still current or the columnar file says it was packed from it.
+    path = archive_path(month)
+    signature = None
+    if path.exists():
+        try:
+            signature = archive_signature(path)
+            conn.execute("ATTACH DATABASE ? AS archive", (f"file:{path}?mode=ro",))
+        except (FileNotFoundError, sqlite3.OperationalError):
+            # Only a pack deleting the file in the meantime is expected; a locked or damaged archive
+            # must not quietly drop its rows from the results
+            if path.exists():
+                raise
+            signature = None
+
+    try:
+        read_sqlite = signature is not None
+        try:
+            archive = ColumnarArchive(columnar_path(month))
+        except FileNotFoundError:
+            pass
+        else:
+            with archive:
+                read_sqlite = read_sqlite and archive.properties.get("packed_from") != signature
+                yield from archive.scan(table, columns, since_ts, until_ts, user_id)
+        if read_sqlite:
+            yield from _select_range(conn, "archive", table, columns, time_column, since_ts, until_ts, user_id)
+    finally:
+        if signature is not None:
+            conn.execute("DETACH DATABASE archive")
 
 # ▼▼▼ CORRECTED FUNCTIONS ▼▼▼
 
-def update_user_roles(user_id: int, role_ids: List[str]):
-    """Saves the current list of role IDs for a user."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        roles_str = ",".join(role_ids)
-        cursor.execute("INSERT OR REPLACE INTO user_roles (user_id, role_ids) VALUES (?, ?)", (user_id, roles_str))
+def update_user_roles(user_id: int, role_ids: Iterable[int]) -> tuple[int, int]:
+    """
+    Saves the current set of role IDs for a user, writing only the difference to what is stored.
+    Returns (roles added, roles removed).
+    """
+    changes = connections.write(_replace_user_roles, user_id, {int(role_id) for role_id in role_ids})
+    stats_cache.invalidate(user_id)
+    return changes
 
-def get_user_roles(user_id: int) -> List[str]:
+def _replace_user_roles(conn: sqlite3.Connection, user_id: int, role_ids: set) -> tuple[int, int]:
+    stored = {row[0] for row in conn.execute("SELECT role_id FROM user_roles WHERE user_id = ?", (user_id,))}
+    added, removed = role_ids - stored, stored - role_ids
+    if removed:
+        conn.executemany("DELETE FROM user_roles WHERE user_id = ? AND role_id = ?", [(user_id, role_id) for role_id in removed])
+    if added:
+        conn.executemany("INSERT INTO user_roles (user_id, role_id) VALUES (?, ?)", [(user_id, role_id) for role_id in added])
+    return len(added), len(removed)
+
+def get_user_roles(user_id: int) -> List[int]:
     """Retrieves the list of saved role IDs for a user."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT role_ids FROM user_roles WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        if result and result[0]:
-            return result[0].split(',')
-        return []
+    return [row[0] for row in connections.fetchall("SELECT role_id FROM user_roles WHERE user_id = ?", (user_id,))]
+
+def get_all_user_roles() -> dict[int, set[int]]:
+    """Returns {user_id: set of stored role IDs} for every stored user, in a single query."""
+    stored = {}
+    for user_id, role_id in connections.fetchall("SELECT user_id, role_id FROM user_roles"):
+        stored.setdefault(user_id, set()).add(role_id)
+    return stored
+
+def apply_role_diffs(added: list, removed: list):
+    """
+    Applies (user_id, role_id) additions and removals to the stored roles in a single transaction,
+    as computed against get_all_user_roles().
+    """
+    def apply(conn: sqlite3.Connection):
+        conn.executemany("DELETE FROM user_roles WHERE user_id = ? AND role_id = ?", removed)
+        conn.executemany("INSERT OR IGNORE INTO user_roles (user_id, role_id) VALUES (?, ?)", added)
+
+    connections.write(apply)
+    for user_id in {user_id for user_id, _ in added} | {user_id for user_id, _ in removed}:
+        stats_cache.invalidate(user_id)
+
+def get_role_members(role_id: int) -> List[int]:
+    """Returns the IDs of every stored user holding the role (uses the role_id index)."""
+    return [row[0] for row in connections.fetchall("SELECT user_id FROM user_roles WHERE role_id = ?", (role_id,))]
+
+def get_role_counts() -> dict[int, int]:
+    """Returns {role_id: number of stored users holding it} for every role, in a single query."""
+    return dict(connections.fetchall("SELECT role_id, COUNT(*) FROM user_roles GROUP BY role_id"))
 
 def log_role_change(user_id: int, role_id: int, action: str, source: str):
     """Logs a single role change to the history table."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO role_history (user_id, role_id, action, source) VALUES (?, ?, ?, ?)",
-            (user_id, role_id, action, source)
+    connections.write(
+        lambda conn: conn.execute(
+            "INSERT INTO role_history (user_id, role_id, action, source, ts) VALUES (?, ?, ?, ?, ?)",
+            (user_id, role_id, action, source, int(time.time()))
         )
+    )
+    stats_cache.invalidate(user_id)
 
-def log_reaction(user_id: int, channel_id: int, message_id: int, emoji: str, event_type: str):
-    """Logs a reaction add or remove event."""
-    with sqlite3.connect(DB_FILE) as conn:
-        timestamp = datetime.utcnow().isoformat()
-        conn.execute(
-            """INSERT INTO reactions (user_id, channel_id, message_id, emoji, event_type, timestamp) 
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (user_id, channel_id, message_id, str(emoji), event_type, timestamp)
-        )
+def apply_role_update(user_id: int, role_ids: Iterable[int], changes: list) -> tuple[int, int]:
+    """
+    Saves a member's current role set and the history rows for the changes that led to it,
+    [(role_id, action, source, ts)], in a single transaction. With role_ids=None only the history
+    is written. Returns (roles added, roles removed) relative to what was stored.
+    """
+    role_ids = None if role_ids is None else {int(role_id) for role_id in role_ids}
+    result = connections.write(_apply_role_update, user_id, role_ids, changes)
+    stats_cache.invalidate(user_id)
+    return result
 
-def log_voice_state_event(user_id: int, channel_id: int, event_type: str):
-    """Logs a voice state change event like mute, deafen, etc."""
-    with sqlite3.connect(DB_FILE) as conn:
-        timestamp = datetime.utcnow().isoformat()
-        conn.execute(
-            "INSERT INTO voice_state_events (user_id, channel_id, event_type, timestamp) VALUES (?, ?, ?, ?)",
-            (user_id, channel_id, event_type, timestamp)
-        )
+def _apply_role_update(conn: sqlite3.Connection, user_id: int, role_ids: set, changes: list) -> tuple[int, int]:
+    result = _replace_user_roles(conn, user_id, role_ids) if role_ids is not None else (0, 0)
+    conn.executemany(
+        "INSERT INTO role_history (user_id, role_id, action, source, ts) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, role_id, action, source, ts) for role_id, action, source, ts in changes]
+    )
+    return result
 
-def log_message_event(message_id: int, user_id: int, channel_id: int, event_type: str, content: str = None):
-    """Logs a message edit or delete event."""
-    with sqlite3.connect(DB_FILE) as conn:
-        timestamp = datetime.utcnow().isoformat()
-        conn.execute(
-            """INSERT INTO message_events (message_id, user_id, channel_id, event_type, timestamp, original_content) 
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (message_id, user_id, channel_id, event_type, timestamp, content)
-        )
\ No newline at end of file
+async def log_reaction(user_id: int, channel_id: int, message_id: int, emoji: str, event_type: str):
+    """Queues a reaction add or remove event."""
+    await writer.submit(
+        """INSERT INTO reactions (user_id, channel_id, message_id, emoji, event_type, ts) 
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, channel_id, message_id, str(emoji), event_type, int(time.time()))
+    )
+
+async def log_voice_state_event(user_id: int, channel_id: int, event_type: str):
+    """Queues a voice state change event like mute, deafen, etc."""
+    await writer.submit(
+        "INSERT INTO voice_state_events (user_id, channel_id, event_type, ts) VALUES (?, ?, ?, ?)",
+        (user_id, channel_id, event_type, int(time.time()))
+    )
+
+async def log_message_event(message_id: int, user_id: int, channel_id: int, event_type: str, content: str = None):
+    """Queues a message edit or delete event."""
+    await writer.submit(
+        """INSERT INTO message_events (message_id, user_id, channel_id, event_type, ts, original_content) 
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (message_id, user_id, channel_id, event_type, int(time.time()), content)
+    )
\ No newline at end of file
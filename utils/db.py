@@ -0,0 +1,162 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from utils import database
+
+class _Lane:
+    """A dedicated thread pool plus a semaphore, so callers wait in the event loop rather than piling up in the pool."""
+
+    def __init__(self, name: str, workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"db-{name}")
+        self.semaphore = asyncio.Semaphore(workers)
+
+    async def run(self, fn, *args, **kwargs):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+class AsyncDatabase:
+    """
+    The async face of utils.database, for use from cogs (`await db.fetch_activity(...)`).
+
+    Reads run on a small pool of reader threads (each with its own long-lived connection),
+    writes on a single writer thread, which is also where the event writer flushes its batches.
+    Heavy analytic queries get a third lane on read-only connections with a time limit.
+    None of them compete with the default executor. Every call's latency (including time
+    spent waiting for a free worker) is recorded per operation.
+    """
+
+    def __init__(self, read_workers: int = 4):
+        self._read_lane = _Lane("read", read_workers)
+        self._write_lane = _Lane("write", 1)
+        self._analytics_lane = _Lane("analytics", database.analytics.size)
+        # {operation: [calls, total seconds, slowest call]}
+        self.latency = {}
+
+        database.writer.run_blocking = self.run_write
+
+    def _record(self, name: str, elapsed: float):
+        stats = self.latency.get(name)
+        if stats is None:
+            self.latency[name] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    async def _timed(self, lane: _Lane, name: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await lane.run(fn, *args, **kwargs)
+        finally:
+            self._record(name, time.perf_counter() - started)
+
+    async def run_read(self, fn, *args, **kwargs):
+        """Runs a blocking read function on the read lane."""
+        return await self._timed(self._read_lane, fn.__name__, fn, *args, **kwargs)
+
+    async def run_write(self, fn, *args, **kwargs):
+        """Runs a blocking write function on the write lane."""
+        return await self._timed(self._write_lane, fn.__name__, fn, *args, **kwargs)
+
+    async def run_analytics(self, fn, *args, timeout: float = None):
+        """
+        Runs fn(conn, *args) on a read-only analytics connection. Raises connections.QueryTimeout
+        if the query runs longer than `timeout` seconds (the configured default if not given).
+        """
+        return await self._timed(self._analytics_lane, fn.__name__, database.analytics.run, fn, *args, timeout=timeout)
+
+    def configure_analytics(self, workers: int = None, timeout: float = None):
+        """Applies the analytics settings from config.yaml. Call before the bot starts."""
+        database.analytics.configure(size=workers, timeout=timeout)
+        self._analytics_lane = _Lane("analytics", database.analytics.size)
+
+    def latency_report(self) -> list[str]:
+        """One line per operation, slowest average first."""
+        rows = sorted(self.latency.items(), key=lambda item: item[1][1] / item[1][0], reverse=True)
+        return [
+            f"{name}: {calls} calls, avg {total / calls * 1000:.2f} ms, max {slowest * 1000:.1f} ms"
+            for name, (calls, total, slowest) in rows
+        ]
+
+    async def close(self):
+        """Drains the event writer, then stops both lanes and closes the connections."""
+        if database.writer.running:
+            await database.writer.close()
+        for lane in (self._read_lane, self._write_lane, self._analytics_lane):
+            lane.executor.shutdown(wait=True)
+        database.connections.close()
+        database.analytics.close()
+
+    # --- Reads ---
+
+    async def fetch_activity(self, user_id: int) -> tuple[int, int]:
+        return await self.run_read(database.get_user_activity, user_id)
+
+    async def fetch_all_activity(self) -> dict[int, tuple[int, int]]:
+        return await self.run_read(database.get_all_user_activity)
+
+    async def fetch_activity_windows(self, user_id: int, windows: set) -> dict:
+        return await self.run_read(database.get_user_activity_windows, user_id, windows)
+
+    async def fetch_all_window_activity(self, window_days: int) -> dict[int, tuple[int, int]]:
+        return await self.run_read(database.get_all_window_activity, window_days)
+
+    async def fetch_all_last_seen(self) -> dict[int, int]:
+        return await self.run_read(database.get_all_last_seen)
+
+    async def fetch_user_stats(self, user_id: int, windows: set = frozenset(), history_limit: int = 5) -> dict:
+        return await self.run_read(database.get_user_stats, user_id, windows, history_limit)
+
+    async def fetch_user_roles(self, user_id: int) -> list[int]:
+        return await self.run_read(database.get_user_roles, user_id)
+
+    async def fetch_role_members(self, role_id: int) -> list[int]:
+        return await self.run_read(database.get_role_members, role_id)
+
+    async def fetch_role_counts(self) -> dict[int, int]:
+        return await self.run_read(database.get_role_counts)
+
+    async def fetch_all_user_roles(self) -> dict[int, set[int]]:
+        return await self.run_read(database.get_all_user_roles)
+
+    async def fetch_leaderboard_page(self, metric: str, period: str, after: tuple = None, limit: int = 10) -> list[tuple[int, int]]:
+        return await self.run_analytics(database.leaderboard_page, metric, period, after, limit)
+
+    # --- Writes ---
+
+    async def update_user_roles(self, user_id: int, role_ids: list[int]) -> tuple[int, int]:
+        return await self.run_write(database.update_user_roles, user_id, role_ids)
+
+    async def log_role_change(self, user_id: int, role_id: int, action: str, source: str):
+        await self.run_write(database.log_role_change, user_id, role_id, action, source)
+
+    async def apply_role_update(self, user_id: int, role_ids: list[int], changes: list) -> tuple[int, int]:
+        return await self.run_write(database.apply_role_update, user_id, role_ids, changes)
+
+    async def apply_role_diffs(self, added: list, removed: list):
+        await self.run_write(database.apply_role_diffs, added, removed)
+
+    async def compact_daily_activity(self, keep_days: int) -> int:
+        return await self.run_write(database.compact_daily_activity, keep_days)
+
+    async def rebuild_user_activity(self) -> int:
+        return await self.run_write(database.rebuild_user_activity)
+
+    async def rebuild_leaderboard(self, metric: str, period: str) -> int:
+        return await self.run_write(database.rebuild_leaderboard, metric, period)
+
+    # --- Queued events (go through the batched event writer) ---
+
+    log_message = staticmethod(database.log_message)
+    log_vc_event = staticmethod(database.log_vc_event)
+    log_reaction = staticmethod(database.log_reaction)
+    log_voice_state_event = staticmethod(database.log_voice_state_event)
+    log_message_event = staticmethod(database.log_message_event)
+    close_stale_vc_sessions = staticmethod(database.close_stale_vc_sessions)
+
+    async def sync_events(self):
+        """Waits until every event queued so far is committed, so the next read includes them."""
+        await database.writer.sync()
+
+db = AsyncDatabase()
@@ -0,0 +1,170 @@
+import asyncio
+import sqlite3
+from itertools import chain, groupby
+from operator import itemgetter
+from utils.connections import ConnectionManager, is_busy_error
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class EventWriter:
+    """
+    A single long-lived database writer with an in-memory queue.
+
+    Event inserts are queued instead of being committed one by one. A background
+    task collects them into batches and commits each batch in one transaction,
+    flushing whenever the batch is full or the oldest queued event has waited
+    `flush_interval` seconds. When the queue is full, `submit` waits until the
+    writer catches up (backpressure). `close` drains everything still queued, and
+    `sync` waits until everything queued so far is committed.
+    Batches are committed through the connection manager's dedicated writer connection.
+    A batch that fails (e.g. on a constraint error) is retried in halves, so only the
+    events that actually fail are dropped, and each of those is logged.
+    """
+
+    def __init__(self, connections: ConnectionManager, batch_size: int = 500, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.connections = connections
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self.events_written = 0
+        self.batches_written = 0
+        self.events_dropped = 0
+
+        # How blocking batch writes are run; utils.db points this at its write lane
+        self.run_blocking = asyncio.to_thread
+
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        """Number of events waiting to be written."""
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self, batch_size: int = None, flush_interval: float = None, max_queue: int = None):
+        """Starts the background writer task. Must be called from inside the event loop."""
+        if self.running:
+            return
+
+        self.batch_size = batch_size or self.batch_size
+        self.flush_interval = flush_interval or self.flush_interval
+        self.max_queue = max_queue or self.max_queue
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, sql: str, params: tuple):
+        """Queues one statement for the next batch."""
+        await self.submit_group([(sql, params)])
+
+    async def submit_group(self, statements: list):
+        """
+        Queues several (sql, params) statements as one event. They are always
+        written in the same transaction, in the order given.
+        If the writer isn't running (e.g. from a script), they are written immediately.
+        """
+        if not self.running:
+            await self.run_blocking(self._write_batch, [statements])
+            return
+
+        # Waits here while the queue is full, slowing producers down to the writer's pace
+        await self._queue.put(statements)
+
+    async def sync(self):
+        """
+        Waits until every event queued before this call has been written (or dropped), flushing the
+        current batch early. Reads made afterwards see them.
+        """
+        if not self.running:
+            return
+        written = asyncio.get_running_loop().create_future()
+        await self._queue.put(written)
+        await written
+
+    async def close(self):
+        """Stops accepting events and flushes everything still queued."""
+        if self.running:
+            await self._queue.put(None) # Sentinel: everything before it still gets written
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+
+            batch = []
+            waiter = None
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+
+            # Keep collecting until the batch is full, the flush interval has passed or sync() waits on it
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, asyncio.Future):
+                    waiter = item
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+
+            if batch:
+                await self._flush(batch)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list):
+        try:
+            await self.run_blocking(self._write_batch, batch)
+        except Exception as e:
+            # Splitting can't help once the busy retries are used up; otherwise narrow down the bad event
+            if len(batch) > 1 and not (isinstance(e, sqlite3.OperationalError) and is_busy_error(e)):
+                half = len(batch) // 2
+                await self._flush(batch[:half])
+                await self._flush(batch[half:])
+                return
+            self._drop(batch, e)
+
+    def _drop(self, batch: list, error: Exception):
+        self.events_dropped += len(batch)
+        print(Style.BRIGHT + Fore.RED + f"❌ Event writer dropped {len(batch)} event(s): {error}")
+        for statements in batch:
+            for sql, params in statements:
+                print(Fore.RED + f"    {' '.join(sql.split())} {params!r}")
+
+    def _write_batch(self, batch: list):
+        """Writes a batch in a single transaction (retried as a whole if the database is busy)."""
+        self.connections.write(self._execute_batch, batch)
+        self.events_written += len(batch)
+        self.batches_written += 1
+
+    @staticmethod
+    def _execute_batch(conn, batch: list):
+        """Consecutive identical statements go through executemany."""
+        statements = chain.from_iterable(batch)
+        for sql, items in groupby(statements, key=itemgetter(0)):
+            conn.executemany(sql, [params for _, params in items])
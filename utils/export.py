@@ -0,0 +1,115 @@
+"""
+Activity export.
+
+Streams raw activity for a date range, optionally for a single user, into a gzip-compressed CSV
+or newline-delimited JSON file. Rows flow from read-only cursors through generators straight into
+the compressor, so memory use stays flat however large the range is. Archived months are read
+in place, so the export covers the full history either way.
+
+CLI usage:
+    python -m utils.export activity.csv.gz --since 2025-01-01 [--until 2025-02-01] [--user ID]
+        [--tables messages reactions] [--format csv|ndjson] [--db /data/server_activity.db]
+"""
+import argparse
+import csv
+import gzip
+import json
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+from utils import database
+
+# {table: columns exported}; every table is filtered and ordered by its time column
+EXPORT_TABLES = {
+    "messages": ("user_id", "channel_id", "message_id", "ts"),
+    "vc_sessions": ("user_id", "channel_id", "started_at", "ended_at"),
+    "vc_events": ("user_id", "channel_id", "event_type", "ts"),
+    "reactions": ("user_id", "channel_id", "message_id", "emoji", "event_type", "ts"),
+    "role_history": ("user_id", "role_id", "action", "source", "ts"),
+}
+TIME_COLUMNS = {"vc_sessions": "started_at"}
+
+FORMATS = ("csv", "ndjson")
+
+def parse_date(value: str) -> int:
+    """A 'YYYY-MM-DD' UTC date as an epoch timestamp."""
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+def iter_table(conn: sqlite3.Connection, table: str, since_ts: int, until_ts: int, user_id: int = None) -> Iterator[tuple]:
+    """Yields a table's exported columns in [since_ts, until_ts), oldest first, archives included."""
+    yield from database.query_events(
+        conn, table, list(EXPORT_TABLES[table]), since_ts, until_ts, user_id, TIME_COLUMNS.get(table, "ts")
+    )
+
+def iter_records(conn: sqlite3.Connection, tables: list, since_ts: int, until_ts: int, user_id: int = None) -> Iterator[tuple[str, tuple]]:
+    """Yields (table, row) for every selected table in turn."""
+    for table in tables:
+        for row in iter_table(conn, table, since_ts, until_ts, user_id):
+            yield table, row
+
+def _write_csv(f, tables: list, records: Iterator[tuple[str, tuple]]):
+    # One sheet for all tables: a table column plus the union of their columns
+    header = ["table"] + list(dict.fromkeys(column for table in tables for column in EXPORT_TABLES[table]))
+    positions = {table: [header.index(column) for column in EXPORT_TABLES[table]] for table in tables}
+    writer = csv.writer(f)
+    writer.writerow(header)
+    for table, row in records:
+        line = [table] + [None] * (len(header) - 1)
+        for position, value in zip(positions[table], row):
+            line[position] = value
+        writer.writerow(line)
+        yield table
+
+def _write_ndjson(f, tables: list, records: Iterator[tuple[str, tuple]]):
+    for table, row in records:
+        f.write(json.dumps({"table": table, **dict(zip(EXPORT_TABLES[table], row))}, ensure_ascii=False))
+        f.write("\n")
+        yield table
+
+def export_activity(out_path: Path, since_ts: int, until_ts: int, user_id: int = None, tables: list = None,
+                    fmt: str = "csv", db_file: Path = None) -> dict[str, int]:
+    """
+    Writes the export to `out_path` (gzip-compressed) and returns {table: rows exported}.
+    Reads through its own read-only connection, so it never holds up the bot's readers or writer.
+    """
+    tables = [table for table in (tables or EXPORT_TABLES) if table in EXPORT_TABLES]
+    write_rows = _write_csv if fmt == "csv" else _write_ndjson
+    counts = dict.fromkeys(tables, 0)
+
+    with closing(sqlite3.connect(f"file:{db_file or database.DB_FILE}?mode=ro", uri=True)) as conn, \
+            gzip.open(out_path, "wt", encoding="utf-8", newline="") as f:
+        for table in write_rows(f, tables, iter_records(conn, tables, since_ts, until_ts, user_id)):
+            counts[table] += 1
+    return counts
+
+def export_filename(since_ts: int, until_ts: int, fmt: str, user_id: int = None) -> str:
+    since = datetime.fromtimestamp(since_ts, timezone.utc).strftime("%Y%m%d")
+    until = datetime.fromtimestamp(until_ts, timezone.utc).strftime("%Y%m%d")
+    user = f"-{user_id}" if user_id else ""
+    return f"activity-{since}-{until}{user}.{fmt}.gz"
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports raw activity for a date range as gzip-compressed CSV or NDJSON.")
+    parser.add_argument("out", type=Path, help="Output file, e.g. activity.csv.gz")
+    parser.add_argument("--since", required=True, help="First day included (YYYY-MM-DD, UTC)")
+    parser.add_argument("--until", help="Day the export stops before (YYYY-MM-DD, UTC; default: now)")
+    parser.add_argument("--user", type=int, help="Only this user's activity")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES), help="Tables to export (default: all)")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--db", type=Path, default=database.DB_FILE, help="Database file (default: the bot's)")
+    args = parser.parse_args()
+
+    since_ts = parse_date(args.since)
+    until_ts = parse_date(args.until) if args.until else int(time.time())
+    started = time.perf_counter()
+    counts = export_activity(args.out, since_ts, until_ts, args.user, args.tables, args.format, args.db)
+
+    for table, count in counts.items():
+        print(f"  {table}: {count:,} rows")
+    print(f"Wrote {args.out} ({args.out.stat().st_size / 1024:,.1f} KiB) in {time.perf_counter() - started:.1f} s.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import deque
+import discord
+from utils.logger import log_summary
+from utils.rate_limit import RateLimiter
+from utils.role_utils import toggled_counterpart_id
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class _PendingJoin:
+    def __init__(self, member: discord.Member):
+        self.member = member
+        self.roles = {}
+        self.notes = []
+        self.queued_at = time.monotonic()
+
+class JoinPipeline:
+    """
+    Applies roles to joining members.
+
+    Joins are normally handled one by one by the cogs. Once more than `surge_joins` members join
+    within `surge_seconds`, join-wave mode starts and lasts until `calm_seconds` pass without a
+    surge. In wave mode the cogs submit their roles here instead:
+
+    - Roles from every cog are merged into a single request per member.
+    - A bounded pool of workers applies them through one shared rate limiter.
+    - The log gets one summary per wave instead of an embed per member.
+    """
+
+    def __init__(self, bot, config: dict):
+        self.bot = bot
+        self.surge_joins = config.get("surge_joins", 10)
+        self.surge_seconds = config.get("surge_seconds", 10)
+        self.calm_seconds = config.get("calm_seconds", 60)
+        self.workers = config.get("workers", 3)
+        self.summary_seconds = config.get("summary_seconds", 60)
+        self.limiter = RateLimiter(config.get("actions_per_second", 2), burst=self.workers)
+
+        # (join time, member ID) for joins inside the surge window, and the IDs among them
+        self._recent = deque()
+        self._recent_ids = set()
+        self._last_surge = None
+        # Members waiting for their roles, in join order; a member is queued once however many cogs submit
+        self._pending = {}
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._busy = 0
+        self._lines = []
+        self._last_summary = time.monotonic()
+        self.longest_wait = 0.0
+
+    def observe(self, member: discord.Member) -> bool:
+        """Counts a join (once per member, whichever cog sees it first). Returns whether a join wave is on."""
+        now = time.monotonic()
+        if member.id not in self._recent_ids:
+            self._recent.append((now, member.id))
+            self._recent_ids.add(member.id)
+        while self._recent and self._recent[0][0] <= now - self.surge_seconds:
+            self._recent_ids.discard(self._recent.popleft()[1])
+
+        if len(self._recent) >= self.surge_joins:
+            if self._last_surge is None:
+                print(Style.BRIGHT + Fore.YELLOW + f"Join wave detected ({len(self._recent)} joins in {self.surge_seconds} s), queueing role assignments.")
+            self._last_surge = now
+        elif self._last_surge is not None and now - self._last_surge > self.calm_seconds:
+            self._last_surge = None
+        return self.surging
+
+    @property
+    def surging(self) -> bool:
+        return self._last_surge is not None or bool(self._pending)
+
+    def submit(self, member: discord.Member, roles: list, note: str, toggle: bool = False):
+        """
+        Queues roles for a member. With toggle=True, a role's toggled counterpart (see 'toggled_roles')
+        is dropped from what the member is about to get, as handle_role_add would remove it.
+        """
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+
+        pending = self._pending.get(member.id)
+        if pending is None:
+            pending = self._pending[member.id] = _PendingJoin(member)
+            self._queue.put_nowait(member.id)
+        for role in roles:
+            if toggle:
+                pending.roles.pop(toggled_counterpart_id(self.bot, role.id), None)
+            pending.roles[role.id] = role
+        pending.notes.append(note)
+
+    async def _worker(self):
+        while True:
+            member_id = await self._queue.get()
+            pending = self._pending.pop(member_id, None)
+            self._busy += 1
+            try:
+                if pending:
+                    await self._apply(pending)
+            except Exception as e:
+                # One member's failure (a deleted role, a database error) must not stop the worker
+                print(Style.BRIGHT + Fore.RED + f"Join wave: failed to process member {member_id}: {e!r}")
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+            # One summary when the wave has been worked through, and periodic ones during a long raid
+            drained = self._queue.empty() and not self._busy
+            if drained or time.monotonic() - self._last_summary > self.summary_seconds:
+                try:
+                    await self._send_summary()
+                except Exception as e:
+                    print(Style.BRIGHT + Fore.RED + f"Join wave: failed to send the summary: {e!r}")
+
+    async def _apply(self, pending: _PendingJoin):
+        member = pending.member
+        roles = [role for role in pending.roles.values() if role not in member.roles]
+        status = "✅"
+        try:
+            if roles:
+                async with self.limiter:
+                    # One request for all of the member's roles (atomic=True would send one per role)
+                    await member.add_roles(*roles, reason="Join wave: " + "; ".join(pending.notes), atomic=False)
+        except discord.NotFound:
+            status = "👋 left before"
+        except discord.HTTPException as e:
+            status = f"❌ {e.status}"
+        waited = time.monotonic() - pending.queued_at
+        self.longest_wait = max(self.longest_wait, waited)
+        self._lines.append(
+            f"{status} {member.mention}: {', '.join(role.mention for role in roles) or 'nothing to add'} "
+            f"({'; '.join(pending.notes)}, {waited:.0f} s)"
+        )
+
+    async def _send_summary(self):
+        if not self._lines:
+            return
+        lines, self._lines = self._lines, []
+        self._last_summary = time.monotonic()
+        print(Style.BRIGHT + Fore.YELLOW + f"Join wave: roles applied for {len(lines)} members (longest wait {self.longest_wait:.0f} s).")
+        await log_summary(self.bot, "Join Wave Role Assignments", lines, "System (Automatic)")
+
+    async def close(self):
+        """Stops the workers; members still queued are reported, not processed."""
+        for task in self._tasks:
+            task.cancel()
+        if self._pending:
+            print(Style.BRIGHT + Fore.RED + f"Join wave: {len(self._pending)} members still queued at shutdown were not processed.")
@@ -0,0 +1,58 @@
+import os
+import yaml
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class KnownUsers:
+    """An immutable snapshot of the known_users config block: who gets which role on their first join."""
+
+    __slots__ = ("ogs", "trolls", "og_role_id", "troll_role_id", "logged_as")
+
+    def __init__(self, block: dict):
+        block = block or {}
+        self.ogs = frozenset(int(item["id"]) for item in block.get("known_ogs") or [])
+        self.trolls = frozenset(int(item["id"]) for item in block.get("known_trolls") or [])
+        self.og_role_id = int(block.get("og_role_id", 0))
+        self.troll_role_id = int(block.get("troll_role_id", 0))
+        # Who the "Known User" log entries are credited to
+        self.logged_as = str(block.get("logged_as", "System"))
+
+    def __len__(self) -> int:
+        return len(self.ogs) + len(self.trolls)
+
+class KnownUsersIndex:
+    """
+    Holds the current KnownUsers snapshot and rebuilds it when the config file changes on disk.
+    The new snapshot replaces the old one in a single assignment, so a join always sees one
+    consistent version; a file that fails to parse keeps the previous snapshot.
+    """
+
+    def __init__(self, path: str, config: dict):
+        self.path = path
+        self.current = KnownUsers(config.get("known_users"))
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """Re-reads the file if it changed since the last load. Returns whether the index was rebuilt."""
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        try:
+            with open(self.path, "r", encoding="utf-8-sig") as f:
+                snapshot = KnownUsers((yaml.safe_load(f) or {}).get("known_users"))
+        except (OSError, yaml.YAMLError, KeyError, TypeError, ValueError) as e:
+            print(Style.BRIGHT + Fore.RED + f"Keeping the previous known users list, {self.path} could not be loaded: {e}")
+            return False
+
+        self.current = snapshot
+        print(Fore.CYAN + f"Reloaded known users ({len(snapshot.ogs)} OGs, {len(snapshot.trolls)} trolls).")
+        return True
@@ -34,4 +34,51 @@ async def log_action(bot, title: str, target_user: discord.Member, responsible_p
     except discord.Forbidden:
         print(f"Error: Bot does not have permission to send messages in channel ID {log_channel_id}.")
     except Exception as e:
-        print(f"An unexpected error occurred in log_action: {e}")
\ No newline at end of file
+        print(f"An unexpected error occurred in log_action: {e}")
+
+async def log_summary(bot, title: str, lines: list[str], responsible_party: str):
+    """
+    Sends one summarized log for a bulk operation instead of an embed per member.
+    The lines are split over as many embeds as needed (sent 10 per message).
+
+    Args:
+        bot: The bot instance to access config and channels.
+        title: The title of the embed (e.g., "Inactivity Demotions").
+        lines: One line per affected member.
+        responsible_party: Who performed the action ("System" or a moderator's name).
+    """
+    log_channel_id = bot.config["log_channel_id"]
+    log_channel = bot.get_channel(int(log_channel_id))
+
+    if not log_channel:
+        print(f"Error: Log channel with ID {log_channel_id} not found.")
+        return
+
+    # Embed descriptions are capped at 4096 characters
+    chunks = [[]]
+    length = 0
+    for line in lines:
+        if chunks[-1] and length + len(line) + 1 > 4000:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(line)
+        length += len(line) + 1
+
+    embeds = []
+    for index, chunk in enumerate(chunks):
+        embed = discord.Embed(
+            title=title if index == 0 else f"{title} (continued)",
+            description="\n".join(chunk) or "Nothing to report.",
+            color=discord.Color.blue(),
+            timestamp=datetime.utcnow()
+        )
+        embed.set_footer(text=f"{len(lines)} members • {responsible_party}")
+        embeds.append(embed)
+
+    try:
+        for start in range(0, len(embeds), 10):
+            await log_channel.send(embeds=embeds[start:start + 10])
+    except discord.Forbidden:
+        print(f"Error: Bot does not have permission to send messages in channel ID {log_channel_id}.")
+    except Exception as e:
+        print(f"An unexpected error occurred in log_summary: {e}")
\ No newline at end of file
@@ -0,0 +1,192 @@
+import time
+import discord
+
+NEVER = float("inf")
+
+class PromotionRule:
+    """One entry of auto_promotion.promotions, with its IDs and thresholds parsed once."""
+    __slots__ = ("index", "name", "source_role_id", "target_role_id", "message_threshold", "vc_threshold_minutes", "logic", "window_days")
+
+    def __init__(self, index: int, rule: dict):
+        self.index = index
+        self.name = rule.get("name", "N/A")
+        self.source_role_id = int(rule.get("source_role_id", 0))
+        self.target_role_id = int(rule.get("target_role_id", 0))
+        self.message_threshold = int(rule.get("message_threshold", 500))
+        self.vc_threshold_minutes = int(rule.get("vc_threshold_minutes", 600))
+        self.logic = str(rule.get("promotion_logic", "AND")).upper()
+        # Optional: only count activity from the last N days instead of lifetime totals
+        self.window_days = int(rule["window_days"]) if rule.get("window_days") else None
+
+    def is_met(self, message_count: int, vc_minutes: int) -> bool:
+        met_messages = message_count >= self.message_threshold
+        met_vc_time = vc_minutes >= self.vc_threshold_minutes
+        return (self.logic == "AND" and met_messages and met_vc_time) or \
+               (self.logic == "OR" and (met_messages or met_vc_time))
+
+class DemotionRule:
+    """One entry of auto_promotion.demotions: the reverse of a promotion, triggered by inactivity."""
+    __slots__ = ("index", "name", "source_role_id", "target_role_id", "inactive_days")
+
+    def __init__(self, index: int, rule: dict):
+        self.index = index
+        self.name = rule.get("name", "N/A")
+        # The role being taken away, and the role the member falls back to
+        self.source_role_id = int(rule.get("source_role_id", 0))
+        self.target_role_id = int(rule.get("target_role_id", 0))
+        self.inactive_days = int(rule.get("inactive_days", 90))
+
+def compile_demotions(config: dict) -> list[DemotionRule]:
+    """Parses auto_promotion.demotions, skipping rules with missing IDs."""
+    rules = [DemotionRule(index, rule) for index, rule in enumerate(config.get("demotions", []))]
+    return [rule for rule in rules if rule.source_role_id and rule.target_role_id]
+
+class UserProgress:
+    """
+    A member's known counters and the next values at which a promotion could change.
+    Both are kept per window ({window_days: [messages, VC minutes]}, None = lifetime).
+    """
+    __slots__ = ("counters", "thresholds", "pending")
+
+    def __init__(self, counters: dict):
+        self.counters = {window: list(values) for window, values in counters.items()}
+        self.thresholds = {}
+        # A newly tracked member is due for one full evaluation
+        self.pending = True
+
+    def counts(self, window_days=None) -> tuple[int, int]:
+        return tuple(self.counters.get(window_days, (0, 0)))
+
+    @property
+    def due(self) -> bool:
+        """True once a counter has crossed one of the precomputed thresholds."""
+        if self.pending:
+            return True
+        for window, (next_messages, next_vc_minutes) in self.thresholds.items():
+            message_count, vc_minutes = self.counters.get(window, (0, 0))
+            if message_count >= next_messages or vc_minutes >= next_vc_minutes:
+                return True
+        return False
+
+class PromotionEngine:
+    """
+    The auto_promotion rules compiled into an index keyed by source role.
+
+    Each tracked member carries the next message count and VC minutes at which one of
+    their applicable rules could flip. Counting a message is a dict lookup and a compare;
+    the rules themselves are only evaluated when a threshold is actually crossed.
+
+    Windowed counters only ever grow in memory while the real window slides, so a crossing
+    on a windowed rule has to be confirmed with fresh counters before promoting (see `needs_refresh`).
+
+    While the demotion sweep is enabled, a member isn't promoted into a role they would be demoted
+    from for inactivity right away; otherwise lifetime totals would keep undoing the demotion.
+    """
+
+    def __init__(self, config: dict):
+        self.enabled = config.get("enabled", False)
+        self.rules_by_source = {}
+        self.progress = {}
+        # {role_id: inactive_days} for roles the demotion sweep takes away from inactive members
+        self.inactive_days = {}
+        if config.get("demotion_sweep", {}).get("enabled", False):
+            for rule in compile_demotions(config):
+                days = self.inactive_days.get(rule.source_role_id, rule.inactive_days)
+                self.inactive_days[rule.source_role_id] = min(days, rule.inactive_days)
+
+        for index, rule_config in enumerate(config.get("promotions", [])):
+            rule = PromotionRule(index, rule_config)
+            # Skip if IDs are missing
+            if not rule.source_role_id or not rule.target_role_id:
+                continue
+            self.rules_by_source.setdefault(rule.source_role_id, []).append(rule)
+
+    @property
+    def windows(self) -> set:
+        """Every activity window used by any rule (None = lifetime)."""
+        return {rule.window_days for rules in self.rules_by_source.values() for rule in rules}
+
+    def candidate_rules(self, member: discord.Member) -> list[PromotionRule]:
+        """Rules the member could still be promoted by (has the source role, lacks the target), in config order."""
+        role_ids = {role.id for role in member.roles}
+        candidates = [
+            rule
+            for role_id in role_ids
+            for rule in self.rules_by_source.get(role_id, ())
+            if rule.target_role_id not in role_ids
+        ]
+        return sorted(candidates, key=lambda rule: rule.index)
+
+    def windows_for(self, member: discord.Member) -> set:
+        """The activity windows the member's candidate rules need counters for."""
+        return {rule.window_days for rule in self.candidate_rules(member)}
+
+    def needs_refresh(self, member: discord.Member) -> bool:
+        """True if a crossing must be confirmed against the database (any windowed candidate rule)."""
+        return any(window is not None for window in self.windows_for(member))
+
+    def observe(self, member: discord.Member, counters: dict) -> UserProgress:
+        """Records fresh {window_days: (messages, VC minutes)} counters for a member, tracking them if needed."""
+        progress = self.progress.get(member.id)
+        if progress is None:
+            progress = self.progress[member.id] = UserProgress(counters)
+        else:
+            progress.counters = {window: list(values) for window, values in counters.items()}
+        return progress
+
+    def count_message(self, user_id: int):
+        """Hot path: bumps a tracked member's message counters."""
+        progress = self.progress.get(user_id)
+        if progress is not None:
+            for counter in progress.counters.values():
+                counter[0] += 1
+
+    def forget(self, user_id: int):
+        """Drops a member's cached progress, e.g. after their roles changed."""
+        self.progress.pop(user_id, None)
+
+    @property
+    def inactivity_cutoff_days(self):
+        """The shortest inactive_days of the roles the demotion sweep takes away, or None."""
+        return min(self.inactive_days.values(), default=None)
+
+    def would_demote(self, rule: PromotionRule, last_seen: int = None) -> bool:
+        """True if the rule's target role is one the demotion sweep would take straight back from a member last seen then."""
+        days = self.inactive_days.get(rule.target_role_id)
+        return days is not None and last_seen is not None and last_seen < time.time() - days * 86400
+
+    def find_promotion(self, member: discord.Member, progress: UserProgress, last_seen: int = None):
+        """
+        Returns (rule, target_role) for the first rule the member now qualifies for, or None.
+        Otherwise re-arms the member's thresholds so the rules aren't looked at again until they can flip.
+        `last_seen` is given by the sweep (None while in voice); live checks come from activity and omit it.
+        """
+        rules = self.candidate_rules(member)
+        held_back = False
+
+        for rule in rules:
+            source_role = member.guild.get_role(rule.source_role_id)
+            target_role = member.guild.get_role(rule.target_role_id)
+
+            # Skip if roles don't exist in the server
+            if not source_role or not target_role:
+                continue
+
+            if rule.is_met(*progress.counts(rule.window_days)):
+                if self.would_demote(rule, last_seen):
+                    held_back = True
+                    continue
+                return rule, target_role
+
+        # Next time anything can change is when a counter reaches a threshold it's still below.
+        # A member held back for inactivity stays due, so their next activity promotes them.
+        progress.pending = held_back
+        progress.thresholds = {}
+        for window in {rule.window_days for rule in rules}:
+            message_count, vc_minutes = progress.counts(window)
+            window_rules = [rule for rule in rules if rule.window_days == window]
+            progress.thresholds[window] = (
+                min((rule.message_threshold for rule in window_rules if message_count < rule.message_threshold), default=NEVER),
+                min((rule.vc_threshold_minutes for rule in window_rules if vc_minutes < rule.vc_threshold_minutes), default=NEVER)
+            )
+        return None
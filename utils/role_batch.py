@@ -0,0 +1,79 @@
+import asyncio
+import time
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+class _PendingRoles:
+    def __init__(self):
+        self.role_ids = None
+        self.changes = []
+        # Updates begun but not yet finished (still resolving their source)
+        self.open = 0
+        self.settled = asyncio.Event()
+        self.settled.set()
+
+class RoleUpdateBatcher:
+    """
+    Coalesces a member's role updates that land within `window` seconds of each other (a toggle is
+    an add and a remove in quick succession) and saves them together: the member's latest role set
+    plus every history row, in one write transaction.
+
+    Each update is begun with its role set as soon as it arrives, then finished with its history rows
+    once their source is known; a batch is written only after all of its updates have finished.
+    `write` is an async callable (user_id, role_ids, [(role_id, action, source, ts)]).
+    """
+
+    def __init__(self, write, window: float = 0.5):
+        self.write = write
+        self.window = window
+        self._pending = {}
+        # {user_id: the task that flushes the member's batch when the window closes}
+        self._flushes = {}
+
+    def _batch(self, user_id: int) -> _PendingRoles:
+        batch = self._pending.get(user_id)
+        if batch is None:
+            batch = self._pending[user_id] = _PendingRoles()
+            self._flushes[user_id] = asyncio.create_task(self._flush_later(user_id, batch))
+        return batch
+
+    def begin(self, user_id: int, role_ids: list[int]):
+        """Records the member's role set as of this update (call in gateway order)."""
+        batch = self._batch(user_id)
+        batch.role_ids = role_ids
+        batch.open += 1
+        batch.settled.clear()
+
+    def finish(self, user_id: int, added: list[int], removed: list[int], source: str):
+        """Adds the history rows for an update begun earlier."""
+        batch = self._batch(user_id)
+        ts = int(time.time())
+        batch.changes += [(role_id, "added", source, ts) for role_id in added]
+        batch.changes += [(role_id, "removed", source, ts) for role_id in removed]
+        batch.open = max(0, batch.open - 1)
+        if not batch.open:
+            batch.settled.set()
+
+    async def _flush_later(self, user_id: int, batch: _PendingRoles):
+        await asyncio.sleep(self.window)
+        await batch.settled.wait()
+        self._flushes.pop(user_id, None)
+        await self._flush(user_id)
+
+    async def _flush(self, user_id: int):
+        batch = self._pending.pop(user_id, None)
+        if batch is None or (batch.role_ids is None and not batch.changes):
+            return
+        try:
+            await self.write(user_id, batch.role_ids, batch.changes)
+        except Exception as e:
+            print(Style.BRIGHT + Fore.RED + f"Failed to save role changes for user {user_id}: {e}")
+
+    async def close(self):
+        """Writes every pending batch right away."""
+        for task in self._flushes.values():
+            task.cancel()
+        self._flushes.clear()
+        for user_id in list(self._pending):
+            await self._flush(user_id)
@@ -1,6 +1,46 @@
 ﻿import discord
 from .logger import log_action
 
+def is_moderator(bot, interaction: discord.Interaction) -> bool:
+    """True for administrators and members holding the configured mod role."""
+    if interaction.user.guild_permissions.administrator:
+        return True
+    mod_role = interaction.guild.get_role(int(bot.config.get("mod_role_id", 0)))
+    return mod_role is not None and mod_role in interaction.user.roles
+
+def toggled_counterpart_id(bot, role_id: int):
+    """The ID of the role that 'toggled_roles' in the config pairs with role_id, or None."""
+    toggles = bot.config.get("toggled_roles", {})
+    role_id_str = str(role_id)
+
+    if role_id_str in toggles:
+        return int(toggles[role_id_str])
+    for key, value in toggles.items():
+        if value == role_id_str:
+            return int(key)
+    return None
+
+async def toggle_role(bot, member: discord.Member, role_to_add: discord.Role, reason: str):
+    """
+    Adds the role and removes its toggled counterpart (see 'toggled_roles' in the config) if the member has it.
+    Returns the role that was removed, if any. Discord errors are left to the caller.
+    """
+    # 1. Add the new role
+    await member.add_roles(role_to_add, reason=reason)
+
+    # 2. Check for conflicting roles to remove
+    conflicting_role_id = toggled_counterpart_id(bot, role_to_add.id)
+
+    # 3. If a conflicting role exists and the user has it, remove it
+    if conflicting_role_id:
+        conflicting_role_obj = member.guild.get_role(conflicting_role_id)
+
+        if conflicting_role_obj and conflicting_role_obj in member.roles:
+            await member.remove_roles(conflicting_role_obj, reason=f"Toggled by adding {role_to_add.name}")
+            return conflicting_role_obj
+
+    return None
+
 async def handle_role_add(bot, member: discord.Member, role_to_add: discord.Role, reason: str, log_title: str, log_responsible_party: str):
     """
     A centralized handler for adding roles.
@@ -10,33 +50,9 @@ async def handle_role_add(bot, member: discord.Member, role_to_add: discord.Role
     if role_to_add in member.roles:
         return # The user already has the role, do nothing.
 
-    removed_role = None # Variable to store the role that gets removed
-
     try:
-        # 1. Add the new role
-        await member.add_roles(role_to_add, reason=reason)
-
-        # 2. Check for conflicting roles to remove
-        toggles = bot.config.get("toggled_roles", {})
-        role_to_add_id = str(role_to_add.id)
-        conflicting_role_id_str = None
-
-        if role_to_add_id in toggles:
-            conflicting_role_id_str = toggles[role_to_add_id]
-        else:
-            for key, value in toggles.items():
-                if value == role_to_add_id:
-                    conflicting_role_id_str = key
-                    break
-        
-        # 3. If a conflicting role exists and the user has it, remove it
-        if conflicting_role_id_str:
-            conflicting_role_id = int(conflicting_role_id_str)
-            conflicting_role_obj = member.guild.get_role(conflicting_role_id)
-
-            if conflicting_role_obj and conflicting_role_obj in member.roles:
-                await member.remove_roles(conflicting_role_obj, reason=f"Toggled by adding {role_to_add.name}")
-                removed_role = conflicting_role_obj # Save the removed role for logging
+        # 1-3. Add the role and drop its toggled counterpart
+        removed_role = await toggle_role(bot, member, role_to_add, reason)
 
         # 4. Construct and send the single log message
         details = f"✅ Added Role: {role_to_add.mention}"
@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import sqlite3
+import time
+from contextlib import closing
+from operator import itemgetter
+from pathlib import Path
+from utils import database
+from utils.columnar import ColumnarArchive, ColumnarWriter
+from utils.db import db
+from utils.schema import MIGRATION_CHUNK_SIZE
+
+# Raw event tables that are rolled up, and the column that splits their counts ('' = no split).
+ROLLUP_SOURCES = {
+    "messages": "''",
+    "reactions": "event_type",
+    "voice_state_events": "event_type",
+    "message_events": "event_type",
+}
+
+# Rolled-up rows are counted per (user, channel, source, event type) per hour and per day.
+_ROLLUP_INTO = """
+    INSERT INTO {target} (user_id, channel_id, {period}, source, event_type, events, last_ts)
+    SELECT user_id, channel_id, ts / {seconds}, '{source}', {event_type}, COUNT(*), MAX(ts) FROM {source}
+    WHERE rowid > ? AND rowid <= ? AND ts IS NOT NULL
+    GROUP BY user_id, channel_id, ts / {seconds}, {event_type}
+    ON CONFLICT(user_id, channel_id, {period}, source, event_type) DO UPDATE SET
+        events = events + excluded.events,
+        last_ts = MAX(last_ts, excluded.last_ts)"""
+
+def _roll_up_chunk(conn: sqlite3.Connection, source: str, chunk_size: int) -> int:
+    watermark = conn.execute("SELECT last_rowid FROM rollup_state WHERE source = ?", (source,)).fetchone()
+    watermark = watermark[0] if watermark else 0
+    rows, end = conn.execute(
+        f"SELECT COUNT(*), MAX(rowid) FROM (SELECT rowid FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+        (watermark, chunk_size)
+    ).fetchone()
+    if not rows:
+        return 0
+
+    for target, period, seconds in (("channel_activity_hourly", "hour", 3600), ("channel_activity_daily", "day", 86400)):
+        conn.execute(
+            _ROLLUP_INTO.format(target=target, period=period, seconds=seconds, source=source, event_type=ROLLUP_SOURCES[source]),
+            (watermark, end)
+        )
+    conn.execute(
+        "INSERT INTO rollup_state (source, last_rowid) VALUES (?, ?) ON CONFLICT(source) DO UPDATE SET last_rowid = excluded.last_rowid",
+        (source, end)
+    )
+    return rows
+
+def roll_up_chunk(source: str, chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    """Rolls up the next chunk of raw rows past the source's watermark. Returns 0 once caught up."""
+    return database.connections.write(_roll_up_chunk, source, chunk_size)
+
+def _rewind_watermark(conn: sqlite3.Connection, source: str):
+    # Once the rows with the highest rowids are deleted, SQLite hands those rowids out again. Nothing
+    # between the highest remaining rowid and the watermark exists anymore, so moving the watermark
+    # down to it keeps new rows from landing behind the watermark uncounted.
+    conn.execute(
+        f"""UPDATE rollup_state SET last_rowid = (SELECT COALESCE(MAX(rowid), 0) FROM {source})
+            WHERE source = ? AND last_rowid > (SELECT COALESCE(MAX(rowid), 0) FROM {source})""",
+        (source,)
+    )
+
+def _prune_chunk(conn: sqlite3.Connection, source: str, cutoff_ts: int, chunk_size: int) -> int:
+    # Only rows behind the watermark have been counted, so only those may go
+    deleted = conn.execute(
+        f"""DELETE FROM {source} WHERE rowid IN (
+                SELECT rowid FROM {source}
+                WHERE ts < ? AND rowid <= (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE source = ?)
+                ORDER BY rowid LIMIT ?)""",
+        (cutoff_ts, source, chunk_size)
+    ).rowcount
+    _rewind_watermark(conn, source)
+    return deleted
+
+def prune_chunk(source: str, cutoff_ts: int, chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    """Deletes up to chunk_size rolled-up raw rows older than the cutoff. Returns 0 when there's nothing left."""
+    return database.connections.write(_prune_chunk, source, cutoff_ts, chunk_size)
+
+def _pending_archive_months(conn: sqlite3.Connection, source: str, cutoff_ts: int, chunk_size: int) -> list:
+    return conn.execute(
+        f"""SELECT strftime('%Y-%m', ts, 'unixepoch'), MIN(rowid), MAX(rowid) FROM (
+                SELECT rowid, ts FROM {source}
+                WHERE ts < ? AND rowid <= (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE source = ?)
+                ORDER BY rowid LIMIT ?)
+            GROUP BY 1""",
+        (cutoff_ts, source, chunk_size)
+    ).fetchall()
+
+def _move_to_archive(conn: sqlite3.Connection, source: str, month: str, cutoff_ts: int, first_rowid: int, last_rowid: int) -> int:
+    column_names = [row[1] for row in conn.execute(f"PRAGMA main.table_info({source})")]
+    columns = ", ".join(column_names)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{source} AS SELECT {columns} FROM main.{source} WHERE 0")
+    # Archive files created before a column was added to the live table need it too
+    archived = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({source})")}
+    for column in column_names:
+        if column not in archived:
+            conn.execute(f"ALTER TABLE archive.{source} ADD COLUMN {column}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{source}_user_ts ON {source} (user_id, ts)")
+
+    start, end = database.month_bounds(month)
+    selection = f"""FROM main.{source} WHERE rowid BETWEEN ? AND ? AND ts >= ? AND ts < ? AND ts < ?
+                    AND rowid <= (SELECT COALESCE(MAX(last_rowid), 0) FROM rollup_state WHERE source = ?)"""
+    params = (first_rowid, last_rowid, start, end, cutoff_ts, source)
+    # Rows keep their rowid, so a move interrupted between the two files is safe to repeat
+    conn.execute(f"INSERT OR IGNORE INTO archive.{source} (rowid, {columns}) SELECT rowid, {columns} {selection}", params)
+    moved = conn.execute(f"DELETE {selection}", params).rowcount
+    _rewind_watermark(conn, source)
+    return moved
+
+def archive_chunk(source: str, cutoff_ts: int, chunk_size: int = MIGRATION_CHUNK_SIZE) -> int:
+    """
+    Moves up to chunk_size rolled-up raw rows older than the cutoff into their monthly archive files.
+    Returns the number of rows moved (0 when there's nothing left).
+    """
+    database.ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    moved = 0
+    for month, first_rowid, last_rowid in database.connections.read(_pending_archive_months, source, cutoff_ts, chunk_size):
+        moved += database.connections.write_attached(
+            {"archive": database.archive_path(month)}, _move_to_archive, source, month, cutoff_ts, first_rowid, last_rowid
+        )
+    return moved
+
+# --- Columnar packing ---
+# Closed archive months are packed from SQLite into columnar files, roughly a tenth of the size.
+# The new columnar file is written under a temporary name and moved into place before the SQLite
+# file is deleted, so readers always find the month's rows in one of them. The columnar file records
+# which SQLite file it was packed from: readers skip that file if it's still there, and a pack
+# interrupted before the delete is finished (never repeated) on the next pass.
+
+def _packed_from(target: Path, source: Path) -> bool:
+    if not target.exists() or not source.exists():
+        return False
+    with ColumnarArchive(target) as archive:
+        return archive.properties.get("packed_from") == database.archive_signature(source)
+
+def _sorted_rows(conn: sqlite3.Connection, table: str, columns: list):
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    select = ", ".join(column if column in present else f"NULL AS {column}" for column in columns)
+    return conn.execute(f"SELECT {select} FROM {table} ORDER BY ts, rowid")
+
+def _pack(source: Path, target: Path, compression: str) -> int:
+    """Writes source's rows merged with target's into a new target. Returns the rows added."""
+    temp = target.with_name(target.name + ".tmp")
+    with closing(sqlite3.connect(f"file:{source}?mode=ro", uri=True)) as conn:
+        previous = ColumnarArchive(target) if target.exists() else None
+        try:
+            archived = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+            tables = archived + [table for table in (previous.tables if previous else ()) if table not in archived]
+            added = 0
+            with ColumnarWriter(temp, compression) as writer:
+                writer.properties["packed_from"] = database.archive_signature(source)
+                for table in tables:
+                    # The legacy text timestamp duplicates ts and isn't carried over
+                    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "timestamp"]
+                    columns += [column for column in (previous.columns(table) if previous else ()) if column not in columns]
+                    if "ts" not in columns:
+                        continue
+                    sources = [_sorted_rows(conn, table, columns)] if table in archived else []
+                    if previous and table in previous.tables:
+                        sources.append(previous.scan(table, columns))
+                    written = writer.write_table(table, columns, heapq.merge(*sources, key=itemgetter(columns.index("ts"))))
+                    added += written - (previous.row_count(table) if previous else 0)
+        finally:
+            if previous:
+                previous.close()
+    temp.replace(target)
+    return added
+
+def pack_month(month: str, compression: str = "lzma") -> int:
+    """
+    Packs a closed month's SQLite archive into its columnar file, merging with anything packed
+    before (rows archived late, e.g. from a history backfill). Returns the number of rows packed.
+    """
+    source = database.archive_path(month)
+    target = database.columnar_path(month)
+
+    packed = 0
+    # Left behind by packs that renamed the SQLite file out of the way first
+    packing = source.with_name(source.name + ".packing")
+    if packing.exists() and not _packed_from(target, packing):
+        packed += _pack(packing, target, compression)
+    packing.unlink(missing_ok=True)
+
+    if source.exists():
+        if not _packed_from(target, source):
+            packed += _pack(source, target, compression)
+        source.unlink()
+    return packed
+
+def pack_closed_months(cutoff_ts: int, compression: str = "lzma") -> int:
+    """Packs every archive month that ended before the cutoff. Returns the number of rows packed."""
+    paths = list(database.ARCHIVE_DIR.glob("????-??.db")) + list(database.ARCHIVE_DIR.glob("????-??.db.packing"))
+    packed = 0
+    for month in sorted({path.name[:7] for path in paths}):
+        if database.month_bounds(month)[1] <= cutoff_ts:
+            packed += pack_month(month, compression)
+    return packed
+
+def prune_hourly_rollups(cutoff_ts: int) -> int:
+    """Drops hourly rollups older than the cutoff; the daily rollups keep the long-term history."""
+    return database.connections.write(
+        lambda conn: conn.execute("DELETE FROM channel_activity_hourly WHERE hour < ?", (cutoff_ts // 3600,)).rowcount
+    )
+
+def _vacuum_step(conn: sqlite3.Connection, pages: int) -> int:
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # sqlite3 only steps a pragma without result columns once, which frees a single page
+    for _ in range(min(pages, free_pages)):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+def vacuum_step(pages: int) -> int:
+    """Returns up to `pages` free pages to the filesystem. Returns how many free pages are left."""
+    return database.connections.write(_vacuum_step, pages)
+
+async def run_retention(config: dict) -> dict:
+    """
+    One maintenance pass: roll up everything new, prune old raw rows (or move them to the
+    monthly archives) and hourly rollups, then shrink the file a few pages at a time. Every step is its own short write
+    transaction, so queued events keep flowing in between. Closed archive months are then packed into
+    columnar files off the write lane.
+    Returns {"rolled_up": rows, "pruned": rows, "packed": rows, "free_pages": pages left}.
+    """
+    chunk_size = config.get("chunk_size", MIGRATION_CHUNK_SIZE)
+    now = int(time.time())
+    raw_cutoff = now - config.get("raw_event_days", 90) * 86400
+    report = {"rolled_up": 0, "pruned": 0, "packed": 0, "free_pages": 0}
+    remove_chunk = archive_chunk if config.get("archive", False) else prune_chunk
+
+    for source in ROLLUP_SOURCES:
+        while rows := await db.run_write(roll_up_chunk, source, chunk_size):
+            report["rolled_up"] += rows
+        while rows := await db.run_write(remove_chunk, source, raw_cutoff, chunk_size):
+            report["pruned"] += rows
+
+    if config.get("archive", False) and config.get("archive_format", "sqlite") == "columnar":
+        report["packed"] = await asyncio.to_thread(pack_closed_months, raw_cutoff, config.get("archive_compression", "lzma"))
+
+    hourly_days = config.get("hourly_rollup_days")
+    if hourly_days:
+        report["pruned"] += await db.run_write(prune_hourly_rollups, now - hourly_days * 86400)
+
+    pages = config.get("vacuum_pages", 256)
+    for _ in range(config.get("vacuum_steps", 20)):
+        report["free_pages"] = await db.run_write(vacuum_step, pages)
+        if not report["free_pages"]:
+            break
+
+    return report
@@ -0,0 +1,379 @@
+"""
+Versioned schema migrations, applied by init_db on every startup.
+
+CLI usage (maintenance; stop the bot first):
+    python -m utils.schema vacuum [--db /data/server_activity.db]
+"""
+import argparse
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+import colorama
+from colorama import Fore, Style
+colorama.init(autoreset=True)
+
+# Rows converted per transaction by chunked data migrations. Small enough that the
+# bot (or another process) never waits long on the write lock during an upgrade.
+MIGRATION_CHUNK_SIZE = 5000
+
+# Raw event tables that carry a timestamp. 'timestamp' is the legacy ISO text column,
+# 'ts' the integer epoch column (UTC seconds) every new row is written with.
+EVENT_TABLES = ["messages", "vc_events", "reactions", "voice_state_events", "message_events", "role_history"]
+
+# --- Migrations ---
+# Each migration is idempotent, so a crash half-way through is fixed by simply running it again.
+
+def _create_base_tables(conn: sqlite3.Connection):
+    """The original tables, as the rest of the bot has always used them."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS messages (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            timestamp TEXT
+        );
+        CREATE TABLE IF NOT EXISTS vc_events (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            timestamp TEXT
+        );
+        CREATE TABLE IF NOT EXISTS reactions (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            emoji TEXT,
+            event_type TEXT NOT NULL,
+            timestamp TEXT
+        );
+        CREATE TABLE IF NOT EXISTS voice_state_events (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            timestamp TEXT
+        );
+        CREATE TABLE IF NOT EXISTS message_events (
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            timestamp TEXT,
+            original_content TEXT
+        );
+        CREATE TABLE IF NOT EXISTS user_roles (
+            user_id INTEGER PRIMARY KEY,
+            role_ids TEXT
+        );
+        CREATE TABLE IF NOT EXISTS role_history (
+            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role_id INTEGER,
+            action TEXT,
+            source TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def _create_user_activity(conn: sqlite3.Connection):
+    """Materialized per-user counters (populated by database.rebuild_user_activity)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            messages_total INTEGER NOT NULL DEFAULT 0,
+            vc_seconds_total INTEGER NOT NULL DEFAULT 0,
+            last_seen INTEGER
+        )""")
+
+def _convert_timestamps_to_epoch(conn: sqlite3.Connection):
+    """
+    Adds an integer 'ts' column to every event table and fills it from the ISO text,
+    one rowid range at a time, committing after each chunk.
+    """
+    for table in EVENT_TABLES:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if "ts" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+            conn.commit()
+
+        low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+        if low is None:
+            continue
+
+        converted = 0
+        for chunk_start in range(low, high + 1, MIGRATION_CHUNK_SIZE):
+            with conn:
+                cursor = conn.execute(
+                    f"""UPDATE {table} SET ts = CAST(strftime('%s', timestamp) AS INTEGER)
+                        WHERE rowid >= ? AND rowid < ? AND ts IS NULL AND timestamp IS NOT NULL""",
+                    (chunk_start, chunk_start + MIGRATION_CHUNK_SIZE)
+                )
+            converted += cursor.rowcount
+
+        print(Fore.CYAN + f"  Converted {converted} timestamps in '{table}'.")
+
+def _create_indexes(conn: sqlite3.Connection):
+    """Indexes for the per-user lookups the bot does on every event."""
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages (user_id, ts);
+        CREATE INDEX IF NOT EXISTS idx_vc_events_user_ts ON vc_events (user_id, ts, event_type);
+        CREATE INDEX IF NOT EXISTS idx_reactions_user_ts ON reactions (user_id, ts);
+        CREATE INDEX IF NOT EXISTS idx_voice_state_events_user_ts ON voice_state_events (user_id, ts);
+        CREATE INDEX IF NOT EXISTS idx_message_events_message ON message_events (message_id);
+        CREATE INDEX IF NOT EXISTS idx_role_history_user_ts ON role_history (user_id, ts);
+    """)
+
+def _create_vc_sessions(conn: sqlite3.Connection):
+    """
+    First-class voice sessions. Historical join/leave pairs are converted into closed sessions
+    (using the same pairing the counters were built with), so VC time is always a plain sum.
+    """
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS vc_sessions (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            started_at INTEGER NOT NULL,
+            last_checkpoint INTEGER NOT NULL,
+            ended_at INTEGER,
+            PRIMARY KEY (user_id, started_at)
+        );
+        CREATE INDEX IF NOT EXISTS idx_vc_sessions_open ON vc_sessions (ended_at) WHERE ended_at IS NULL;
+    """)
+
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO vc_sessions (user_id, channel_id, started_at, last_checkpoint, ended_at)
+            SELECT user_id, prev_channel_id, prev_ts, ts, ts
+            FROM (
+                SELECT user_id, event_type, ts,
+                       LAG(event_type) OVER w AS prev_type,
+                       LAG(ts) OVER w AS prev_ts,
+                       LAG(channel_id) OVER w AS prev_channel_id
+                FROM vc_events
+                WINDOW w AS (PARTITION BY user_id ORDER BY ts, rowid)
+            )
+            WHERE event_type = 'leave' AND prev_type = 'join' AND prev_ts IS NOT NULL AND ts IS NOT NULL""")
+
+def _create_daily_activity(conn: sqlite3.Connection):
+    """
+    Per-user daily activity buckets (day = UTC days since the epoch) for windowed promotion rules.
+    Seeded from the raw messages and from voice sessions (credited to the day they started).
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity_daily (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            vc_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID""")
+
+    with conn:
+        conn.execute("DELETE FROM user_activity_daily")
+        conn.execute("""
+            INSERT INTO user_activity_daily (user_id, day, messages)
+            SELECT user_id, ts / 86400, COUNT(*) FROM messages WHERE ts IS NOT NULL GROUP BY user_id, ts / 86400""")
+        conn.execute("""
+            INSERT INTO user_activity_daily (user_id, day, vc_seconds)
+            SELECT user_id, started_at / 86400, SUM(last_checkpoint - started_at) FROM vc_sessions
+            WHERE true
+            GROUP BY user_id, started_at / 86400
+            ON CONFLICT(user_id, day) DO UPDATE SET vc_seconds = excluded.vc_seconds""")
+
+def _index_last_seen(conn: sqlite3.Connection):
+    """Lets the inactivity job read only the users past its cutoff."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_last_seen ON user_activity (last_seen)")
+
+def _normalize_user_roles(conn: sqlite3.Connection):
+    """
+    Replaces the comma-joined user_roles.role_ids column with one (user_id, role_id) row per role,
+    indexed by role so "who has role X" is an index lookup. The legacy rows are converted in place.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(user_roles)")]
+    if "role_ids" in columns:
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS user_roles_legacy")
+            conn.execute("ALTER TABLE user_roles RENAME TO user_roles_legacy")
+
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS user_roles (
+            user_id INTEGER NOT NULL,
+            role_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, role_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_user_roles_role ON user_roles (role_id);
+    """)
+
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_roles_legacy'").fetchone()
+    if not legacy:
+        return
+
+    with conn:
+        rows = conn.execute("SELECT user_id, role_ids FROM user_roles_legacy WHERE role_ids IS NOT NULL AND role_ids != ''")
+        conn.executemany(
+            "INSERT OR IGNORE INTO user_roles (user_id, role_id) VALUES (?, ?)",
+            [
+                (user_id, int(role_id))
+                for user_id, role_ids in rows.fetchall()
+                for role_id in role_ids.split(",") if role_id.strip()
+            ]
+        )
+        conn.execute("DROP TABLE user_roles_legacy")
+
+def _create_rollups(conn: sqlite3.Connection):
+    """
+    Hourly and daily per-user, per-channel event counts (see utils.rollups), a watermark per
+    rolled-up table, and incremental auto-vacuum so pruned raw rows actually shrink the file.
+    """
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS channel_activity_hourly (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            event_type TEXT NOT NULL DEFAULT '',
+            events INTEGER NOT NULL DEFAULT 0,
+            last_ts INTEGER,
+            PRIMARY KEY (user_id, channel_id, hour, source, event_type)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_channel_activity_hourly_hour ON channel_activity_hourly (hour);
+        CREATE TABLE IF NOT EXISTS channel_activity_daily (
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            event_type TEXT NOT NULL DEFAULT '',
+            events INTEGER NOT NULL DEFAULT 0,
+            last_ts INTEGER,
+            PRIMARY KEY (user_id, channel_id, day, source, event_type)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            source TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+    # On an existing file the setting only takes effect with a full VACUUM, which rewrites the whole
+    # file under an exclusive lock. That's left to the operator (see vacuum below), not done at startup.
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+def _create_leaderboard(conn: sqlite3.Connection):
+    """Precomputed rankings per (metric, period), indexed in rank order for keyset pagination."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            metric TEXT NOT NULL,
+            period TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (metric, period, user_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_rank ON leaderboard (metric, period, score DESC, user_id);
+    """)
+
+def _add_message_ids(conn: sqlite3.Connection):
+    """
+    Stores the Discord message ID with every new message so imported history can be deduplicated
+    (older rows don't have one), and tracks how far back each channel has been backfilled.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+    if "message_id" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN message_id INTEGER")
+        conn.commit()
+
+    conn.executescript("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_message_id ON messages (message_id) WHERE message_id IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS backfill_state (
+            channel_id INTEGER PRIMARY KEY,
+            before_id INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            imported INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER
+        );
+    """)
+
+# (version, description, function). Append new migrations to the end; never renumber.
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "user activity counters", _create_user_activity),
+    (3, "integer epoch timestamps", _convert_timestamps_to_epoch),
+    (4, "event indexes", _create_indexes),
+    (5, "voice sessions", _create_vc_sessions),
+    (6, "daily activity buckets", _create_daily_activity),
+    (7, "last seen index", _index_last_seen),
+    (8, "normalized user roles", _normalize_user_roles),
+    (9, "activity rollups", _create_rollups),
+    (10, "leaderboard", _create_leaderboard),
+    (11, "message ids and backfill state", _add_message_ids),
+]
+
+# Version that introduced user_activity; the caller seeds the counters when it gets applied.
+USER_ACTIVITY_VERSION = 2
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Returns the highest applied migration version (0 for a fresh database)."""
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def initialize_database(db_file: Path) -> list[int]:
+    """
+    Brings the database up to the latest schema version.
+    Safe to call on every startup. Returns the versions that were applied this time.
+    """
+    applied = []
+
+    with closing(sqlite3.connect(db_file)) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at INTEGER NOT NULL
+            )""")
+        current_version = get_schema_version(conn)
+
+        for version, description, migrate in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            print(Style.BRIGHT + Fore.YELLOW + f"🗃 Applying schema migration {version}: {description}...")
+            migrate(conn)
+            with conn:
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, int(time.time()))
+                )
+            applied.append(version)
+
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print(
+                Style.BRIGHT + Fore.YELLOW + "Incremental vacuum isn't active yet, so pruned rows won't shrink the file. "
+                "Run 'python -m utils.schema vacuum' once while the bot is stopped."
+            )
+
+    return applied
+
+def vacuum(db_file: Path) -> tuple[int, int]:
+    """
+    Rebuilds the database with a full VACUUM, which also switches on incremental auto-vacuum.
+    Holds an exclusive lock for the whole rewrite, so the bot and other writers must be stopped.
+    Returns the file size before and after, in bytes.
+    """
+    before = Path(db_file).stat().st_size
+    with closing(sqlite3.connect(db_file)) as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before, Path(db_file).stat().st_size
+
+def main():
+    from utils.database import DB_FILE
+
+    parser = argparse.ArgumentParser(description="Database maintenance. Stop the bot before running it.")
+    parser.add_argument("command", choices=["vacuum"])
+    parser.add_argument("--db", type=Path, default=DB_FILE, help="Database file (default: the bot's)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    before, after = vacuum(args.db)
+    print(f"Vacuumed {args.db}: {before / 1024 ** 2:,.1f} MiB -> {after / 1024 ** 2:,.1f} MiB in {time.perf_counter() - started:.1f} s.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Promotion what-if simulator.
+
+Evaluates a candidate set of auto_promotion rules against every stored user's activity
+counters and saved roles, without touching the live bot. Always runs on a snapshot copy
+of the database.
+
+CLI usage:
+    python -m utils.simulator candidate_rules.yaml [--db /data/server_activity.db] [--show-members]
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from array import array
+from itertools import compress
+from contextlib import closing
+from pathlib import Path
+import yaml
+from utils.database import DB_FILE
+from utils.promotions import PromotionRule
+
+def snapshot_database(db_file: Path, snapshot_path: Path):
+    """Copies the live database to snapshot_path with SQLite's online backup API (safe while the bot writes)."""
+    with closing(sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)) as src, closing(sqlite3.connect(snapshot_path)) as dst:
+        src.backup(dst)
+
+def load_rules(rules_data) -> list[PromotionRule]:
+    """Accepts a list of rules, an auto_promotion block, or a whole config file."""
+    if isinstance(rules_data, dict):
+        rules_data = rules_data.get("auto_promotion", rules_data).get("promotions", [])
+    rules = [PromotionRule(index, rule) for index, rule in enumerate(rules_data or [])]
+    return [rule for rule in rules if rule.source_role_id and rule.target_role_id]
+
+class ActivityColumns:
+    """
+    Every stored user's counters as parallel, array-backed columns, one pair per activity window.
+    Users are referred to by their position in the columns.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, windows: set = frozenset({None})):
+        self.user_ids = array("q")
+        # {role_id: positions of the users holding it}
+        self._role_members = {}
+        # {window_days: (message counts, VC minutes)}, None = lifetime totals
+        self.windows = {}
+
+        lifetime_messages, lifetime_vc = array("q"), array("q")
+        rows = conn.execute("""
+            SELECT r.user_id, COALESCE(a.messages_total, 0), COALESCE(a.vc_seconds_total, 0) / 60
+            FROM (SELECT DISTINCT user_id FROM user_roles) r LEFT JOIN user_activity a ON a.user_id = r.user_id""")
+        for user_id, message_count, vc_minutes in rows:
+            self.user_ids.append(user_id)
+            lifetime_messages.append(message_count)
+            lifetime_vc.append(vc_minutes)
+        self.windows[None] = (lifetime_messages, lifetime_vc)
+
+        positions = {user_id: index for index, user_id in enumerate(self.user_ids)}
+        for user_id, role_id in conn.execute("SELECT user_id, role_id FROM user_roles"):
+            self._role_members.setdefault(role_id, set()).add(positions[user_id])
+        self._role_members = {role_id: frozenset(members) for role_id, members in self._role_members.items()}
+        for window_days in windows:
+            if window_days is None:
+                continue
+            messages, vc = array("q", bytes(8 * len(self))), array("q", bytes(8 * len(self)))
+            rows = conn.execute(
+                """SELECT user_id, SUM(messages), SUM(vc_seconds) / 60 FROM user_activity_daily
+                   WHERE day > ? GROUP BY user_id""",
+                (int(time.time()) // 86400 - window_days,)
+            )
+            for user_id, message_count, vc_minutes in rows:
+                index = positions.get(user_id)
+                if index is not None:
+                    messages[index] = message_count
+                    vc[index] = vc_minutes
+            self.windows[window_days] = (messages, vc)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def holders(self, role_id: int) -> frozenset[int]:
+        """Positions of the users who hold the role."""
+        return self._role_members.get(role_id, frozenset())
+
+    def at_least(self, positions: list[int], window_days, column: int, threshold: int) -> set[int]:
+        """
+        The given positions whose counter (column 0 = messages, 1 = VC minutes) in the window reaches
+        the threshold, checked in one map/compress pass with no Python-level loop.
+        """
+        values = self.windows[window_days][column]
+        return set(compress(positions, map(threshold.__le__, map(values.__getitem__, positions))))
+
+def simulate(rules: list[PromotionRule], columns: ActivityColumns) -> dict[str, list[int]]:
+    """
+    Returns {rule name: [user IDs it would promote]}.
+    Like the live engine, rules are applied in config order and each user gets at most one promotion per pass.
+    Each rule works on index sets: set operations on the role holders narrow it down to its candidates,
+    each threshold is checked against its column for all of them at once, and the results are combined
+    the way PromotionRule.is_met combines them.
+    """
+    promoted = set()
+    results = {}
+
+    for rule in rules:
+        candidates = list(columns.holders(rule.source_role_id) - columns.holders(rule.target_role_id) - promoted)
+        met_messages = columns.at_least(candidates, rule.window_days, 0, rule.message_threshold)
+        met_vc = columns.at_least(candidates, rule.window_days, 1, rule.vc_threshold_minutes)
+        if rule.logic == "AND":
+            selected = met_messages & met_vc
+        elif rule.logic == "OR":
+            selected = met_messages | met_vc
+        else:
+            selected = set()
+
+        promoted |= selected
+        results[rule.name] = [columns.user_ids[index] for index in sorted(selected)]
+
+    return results
+
+def run_simulation(db_file: Path, rules_data) -> tuple[int, dict[str, list[int]]]:
+    """Snapshots the database, simulates the rules on the copy and returns (users evaluated, results)."""
+    rules = load_rules(rules_data)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_path = Path(temp_dir) / "simulation.db"
+        snapshot_database(db_file, snapshot_path)
+        with closing(sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)) as conn:
+            columns = ActivityColumns(conn, {rule.window_days for rule in rules})
+
+    return len(columns), simulate(rules, columns)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates candidate promotion rules against the activity database.")
+    parser.add_argument("rules", help="YAML file with the candidate rules (a list, an auto_promotion block or a full config)")
+    parser.add_argument("--db", default=str(DB_FILE), help="Path to the live database")
+    parser.add_argument("--show-members", action="store_true", help="List the IDs of the affected members")
+    args = parser.parse_args()
+
+    with open(args.rules, "r", encoding="utf-8") as f:
+        rules_data = yaml.safe_load(f)
+
+    user_count, results = run_simulation(Path(args.db), rules_data)
+    print(f"Evaluated {user_count} users.")
+    for name, user_ids in results.items():
+        print(f"{name}: {len(user_ids)} would be promoted")
+        if args.show_members:
+            for user_id in user_ids:
+                print(f"  {user_id}")
+
+if __name__ == "__main__":
+    main()
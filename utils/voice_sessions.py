@@ -0,0 +1,72 @@
+import time
+from utils import database
+
+class VoiceSessionTracker:
+    """
+    In-memory map of open voice sessions (user_id -> channel, start, last checkpoint).
+    Every change is mirrored to the vc_sessions table through the batched writer.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.sessions
+
+    def live_seconds(self, user_id: int, now: int = None) -> int:
+        """VC seconds the user has accumulated since their session was last checkpointed."""
+        session = self.sessions.get(user_id)
+        if not session:
+            return 0
+        return max(0, (now or int(time.time())) - session["last_checkpoint"])
+
+    async def open(self, user_id: int, channel_id: int, now: int = None):
+        """Starts a session, closing any session the user still had open."""
+        now = now or int(time.time())
+        if user_id in self.sessions:
+            await self.close(user_id, now)
+
+        self.sessions[user_id] = {"channel_id": channel_id, "started_at": now, "last_checkpoint": now}
+        await database.open_vc_session(user_id, channel_id, now)
+
+    async def move(self, user_id: int, channel_id: int, now: int = None):
+        """A channel move ends the current session and starts a new one in the new channel."""
+        await self.open(user_id, channel_id, now)
+
+    async def close(self, user_id: int, now: int = None):
+        session = self.sessions.pop(user_id, None)
+        if not session:
+            return
+        await database.close_vc_session(user_id, session["started_at"], now or int(time.time()))
+
+    async def checkpoint_all(self, now: int = None):
+        """Credits every open session up to now in a single transaction."""
+        now = now or int(time.time())
+        for session in self.sessions.values():
+            session["last_checkpoint"] = now
+        await database.checkpoint_vc_sessions(
+            [(user_id, session["started_at"]) for user_id, session in self.sessions.items()], now
+        )
+
+    async def close_all(self, now: int = None):
+        now = now or int(time.time())
+        for user_id in list(self.sessions):
+            await self.close(user_id, now)
+
+    async def reconcile(self, voice_members: dict[int, int], now: int = None):
+        """
+        Syncs the map with who is actually in voice right now ({user_id: channel_id}),
+        e.g. after a restart or a gateway reconnect where leave/join events were missed.
+        """
+        now = now or int(time.time())
+
+        for user_id in list(self.sessions):
+            if user_id not in voice_members:
+                await self.close(user_id, now)
+
+        for user_id, channel_id in voice_members.items():
+            session = self.sessions.get(user_id)
+            if not session:
+                await self.open(user_id, channel_id, now)
+            elif session["channel_id"] != channel_id:
+                await self.move(user_id, channel_id, now)